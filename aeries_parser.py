@@ -1,16 +1,254 @@
+import io
+
+# Column header aliases used by the Aeries "Gradebook Details" tables.
+# Matching is done on lowercased, stripped cell text.
+_ASSIGNMENT_COLUMNS = {
+    'description': 'description',
+    'assignment': 'description',
+    'category': 'category',
+    'score': 'score',
+    'comment': 'comment',
+    'date completed': 'date_completed',
+    'completed': 'date_completed',
+    'due date': 'due_date',
+    'due': 'due_date',
+}
+
+_CATEGORY_WEIGHT_HEADERS = ('perc of grade', '% of grade', 'percent of grade', 'weight')
+
+
+def _split_cells(line):
+    """Split one pasted row into stripped cells.
+
+    Aeries copies as tab-separated text; some browsers turn the tabs into runs
+    of spaces, so fall back to splitting on two or more spaces.  Plain
+    str.split is used on purpose so that huge pastes stay linear.
+
+    Empty cells are kept for tab-separated rows so that positions still line
+    up with the header row.
+    """
+    line = line.rstrip('\r\n')
+    if '\t' in line:
+        return [cell.strip() for cell in line.split('\t')]
+    return [cell.strip() for cell in line.split('  ') if cell.strip()]
+
+
+def _to_float(text):
+    """Parse a number like '8', '8.5', '1,000' or '90.00%'; None if not a number"""
+    text = text.replace(',', '').rstrip('%').strip()
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _parse_score(cell):
+    """
+    Parse an Aeries score cell such as '8 / 10', '8/10' or '/ 35'.
+
+    Returns:
+        tuple: (points_earned, points_possible, earned_text) or None if the
+        cell is not a score.  points_earned is None for ungraded work.
+    """
+    earned_text, sep, possible_text = cell.partition('/')
+    if not sep:
+        return None
+    possible = _to_float(possible_text)
+    if possible is None:
+        return None
+    earned_text = earned_text.strip()
+    return _to_float(earned_text), possible, earned_text
+
+
+def _cell(cells, columns, field):
+    """Return the cell for a header column, or None if the row is too short"""
+    index = columns.get(field)
+    if index is None or index >= len(cells):
+        return None
+    return cells[index]
+
+
+def _assignment_record(description, category, score, extra=None):
+    """Build one assignment dict in the shape import_preview.html expects
+
+    `score` is the tuple returned by _parse_score, or None.
+    """
+    record = {
+        'description': description or '',
+        'category': category or None,
+        'points_earned': None,
+        'points_possible': 0.0,
+        'comment': '',
+        'date_completed': None,
+        'due_date': None,
+        'needs_review': False,
+        'notes': '',
+    }
+    if extra:
+        record.update(extra)
+
+    notes = []
+    if score is None:
+        notes.append('Could not read score')
+    else:
+        earned, possible, earned_text = score
+        record['points_earned'] = earned
+        record['points_possible'] = possible
+        if earned is None and earned_text:
+            notes.append(f'Score "{earned_text}" treated as not graded')
+        if possible <= 0:
+            notes.append('No points possible')
+        elif earned is not None and earned > possible:
+            notes.append('Extra credit')
+    if not record['description']:
+        notes.append('Missing description')
+    if not category:
+        notes.append('Missing category')
+
+    record['needs_review'] = any(note != 'Extra credit' for note in notes)
+    record['notes'] = '; '.join(notes)
+    return record
+
+
+def iter_aeries_rows(lines):
+    """
+    Stream records out of a pasted Aeries gradebook table.
+
+    The paste is read one line at a time in a single pass, so memory stays
+    bounded by the longest line no matter how many rows are pasted.
+
+    Args:
+        lines: Any iterable of text lines (a list, an open file, io.StringIO...)
+
+    Yields:
+        tuple: ('assignment', assignment_dict) for each assignment row and
+        ('category', name, weight) for each row of the category totals footer.
+    """
+    columns = None        # {field: cell index} from the assignments header row
+    header_width = 0      # number of cells in the assignments header row
+    in_footer = False     # True once the category totals header has been seen
+    weight_index = 1
+
+    for line in lines:
+        cells = _split_cells(line)
+        if not any(cells):
+            continue
+
+        # Only rows mentioning a header word can be header rows (the
+        # assignments header always has a Score column); checking the whole
+        # line first keeps the common data row cheap.
+        lowered_line = line.lower()
+        if 'category' in lowered_line or 'score' in lowered_line:
+            lowered = [cell.lower() for cell in cells]
+
+            # Category totals header: "Category  Perc of Grade  Points  Max ..."
+            if 'category' in lowered and any(h in lowered for h in _CATEGORY_WEIGHT_HEADERS):
+                in_footer = True
+                for index, cell in enumerate(lowered):
+                    if cell in _CATEGORY_WEIGHT_HEADERS:
+                        weight_index = index
+                        break
+                continue
+
+            # Assignments header: "#  Description  Category  Score ..." (or
+            # "Assignment" for Description). Data rows always have a score.
+            if (not in_footer and any(cell in _ASSIGNMENT_COLUMNS for cell in lowered)
+                    and not any(_parse_score(cell) for cell in cells if '/' in cell)):
+                columns = {}
+                for index, cell in enumerate(lowered):
+                    field = _ASSIGNMENT_COLUMNS.get(cell)
+                    if field and field not in columns:
+                        columns[field] = index
+                header_width = len(cells)
+                continue
+
+        if in_footer:
+            name = cells[0]
+            if not name or name.lower() == 'total' or len(cells) <= weight_index:
+                continue
+            weight = _to_float(cells[weight_index])
+            if weight is not None:
+                yield ('category', name, weight)
+            continue
+
+        if columns and 'score' in columns:
+            # Rows may be missing empty cells entirely, so only trust the
+            # header positions when the row is at least as wide as the score.
+            score = _parse_score(cells[columns['score']]) if columns['score'] < len(cells) else None
+            if score:
+                extra = None
+                # Rows split on spaces lose their empty cells, so the columns
+                # after the score only line up if none are missing
+                if '\t' in line or len(cells) >= header_width:
+                    extra = {
+                        'comment': _cell(cells, columns, 'comment') or '',
+                        'date_completed': _cell(cells, columns, 'date_completed') or None,
+                        'due_date': _cell(cells, columns, 'due_date') or None,
+                    }
+                yield ('assignment', _assignment_record(
+                    _cell(cells, columns, 'description'), _cell(cells, columns, 'category'), score, extra))
+                continue
+
+        # No usable header: the score is the first "x / y" cell, and the text
+        # cells before it are (optional number,) description, category.
+        for index, cell in enumerate(cells):
+            score = _parse_score(cell) if '/' in cell else None
+            if score:
+                text_cells = [c for c in cells[:index] if c and _to_float(c) is None]
+                description = text_cells[0] if text_cells else None
+                category = text_cells[1] if len(text_cells) > 1 else None
+                yield ('assignment', _assignment_record(description, category, score))
+                break
+        else:
+            # A footer row pasted without its header: "Labs  30.00%  ..."
+            if len(cells) > 1 and cells[0] and cells[1].endswith('%') and cells[0].lower() != 'total':
+                weight = _to_float(cells[1])
+                if weight is not None:
+                    yield ('category', cells[0], weight)
+
+
 def parse_aeries_grades(text):
     """
-    Manual grade entry function.
-    Returns an empty structure that can be filled in by the user.
-    
+    Parse a pasted Aeries gradebook table.
+
+    Args:
+        text: The pasted text, or any iterable of lines
+
     Returns:
-        dict: Empty structure for manual grade entry
+        dict: {'categories': {name: weight}, 'assignments': [assignment dicts]}.
+        When the paste has no category totals, every category found gets an
+        equal share of the weight.
     """
+    lines = io.StringIO(text) if isinstance(text, str) else text
+
+    categories = {}
+    assignments = []
+    for record in iter_aeries_rows(lines):
+        if record[0] == 'assignment':
+            assignments.append(record[1])
+        else:
+            categories[record[1]] = record[2]
+
+    if not categories:
+        names = {a['category'] for a in assignments if a['category']}
+        if names:
+            share = 100.0 / len(names)
+            categories = {name: share for name in sorted(names)}
+        else:
+            categories = {'Assignments': 100.0}
+
+    for assignment in assignments:
+        if assignment['category'] not in categories:
+            assignment['needs_review'] = True
+            note = f'Unknown category "{assignment["category"]}"' if assignment['category'] else ''
+            if note and note not in assignment['notes']:
+                assignment['notes'] = '; '.join(n for n in (assignment['notes'], note) if n)
+
     return {
-        'categories': {
-            'Assignments': 100.0  # Default category with 100% weight
-        },
-        'assignments': []  # Will be filled in by the user
+        'categories': categories,
+        'assignments': assignments
     }
 
 
@@ -1,17 +1,30 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, Flask, Response, current_app, get_flashed_messages, render_template, stream_template, stream_with_context, request, redirect, url_for, session, flash, jsonify, make_response
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+import hashlib
+import json
 import os
-from database import get_db_connection, init_db
-from aeries_parser import parse_aeries_grades, calculate_grade
+import sqlite3
+from database import get_db, close_db, init_db
+import config
+from cache import TTLCache, FragmentCache
+import metrics
+from passwords import HashingBusy, hash_password, needs_rehash, verify_password
+from markupsafe import Markup
+from jinja2 import FileSystemBytecodeCache
+from aeries_parser import parse_aeries_grades
+from grade_engine import get_class_grade, get_category_rows, calculate_grades_bulk
+from what_if import solve_what_if
+from batch import BatchConflict, BatchError, apply_batch, validate_operations
+from importer import read_import_form, read_category_weights, reimport, validate_rows, write_import
+from export import FORMATS as EXPORT_FORMATS, stream_export
+from gpa import LEVELS, compute_gpa, cutoffs_from_text, cutoffs_to_json, cutoffs_to_text, parse_cutoffs
+from timeline import BUCKETS as TIMELINE_BUCKETS, class_timeline, downsample, user_gpa_timeline
 
-app = Flask(__name__)
-app.secret_key = os.urandom(24)  # Secret key for sessions
+# Routes live on a blueprint so create_app can build as many apps as needed
+bp = Blueprint('grades', __name__)
 
-# Initialize Flask-Login
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'grades.login'
 
 # User class for Flask-Login
 class User(UserMixin):
@@ -19,95 +32,239 @@ class User(UserMixin):
         self.id = id
         self.username = username
 
+# Assignment list page sizes
+ASSIGNMENTS_PER_PAGE = 100
+MAX_ASSIGNMENTS_PER_PAGE = 500
+
+# Usernames allowed to export the whole database (comma separated)
+EXPORT_ADMINS = {name.strip() for name in os.environ.get('GRADES_EXPORT_ADMINS', '').split(',') if name.strip()}
+
+class AppCaches:
+    """The in-process caches of one app
+    
+    Keys don't name the database, so every app gets its own set (see
+    get_caches) and apps on different databases never share entries.
+    """
+    def __init__(self):
+        # Rendered class page fragments, keyed by class data version
+        self.fragments = FragmentCache(max_bytes=32 * 1024 * 1024)
+        
+        # GPA timelines keyed by user and the versions of all their classes
+        self.gpa_timelines = TTLCache(maxsize=1024, ttl=300)
+        
+        # GPA results keyed by user and the versions of all their classes, so any
+        # write to a class, category or assignment makes the old entry unreachable
+        self.gpa = TTLCache(maxsize=4096, ttl=300)
+        
+        # Users already validated recently are served from memory instead of the DB
+        self.users = TTLCache(maxsize=4096, ttl=300)
+
+def get_caches():
+    """The caches of the current app"""
+    return current_app.extensions['grades_caches']
+
+def invalidate_user(user_id):
+    """Forget a cached user; call after anything changes their account"""
+    get_caches().users.invalidate(str(user_id))
+
 @login_manager.user_loader
 def load_user(user_id):
-    conn = get_db_connection()
+    user_id = str(user_id)
+    user_cache = get_caches().users
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    conn = get_db()
     user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-    conn.close()
     if user:
-        return User(user['id'], user['username'])
+        user_obj = User(user['id'], user['username'])
+        user_cache.set(user_id, user_obj)
+        return user_obj
     return None
 
-# Initialize database on startup
-with app.app_context():
-    if not os.path.exists('grades.db'):
-        init_db()
-
-@app.route('/')
+@bp.route('/')
 def home():
     """Home page - redirects to dashboard if logged in, otherwise to login"""
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
+        return redirect(url_for('.dashboard'))
+    return redirect(url_for('.login'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Login page"""
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         
-        conn = get_db_connection()
+        conn = get_db()
         user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
         
-        if user and check_password_hash(user['password'], password):
+        try:
+            valid = user is not None and verify_password(user['password'], password)
+        except HashingBusy:
+            flash('The server is busy, please try again in a moment', 'error')
+            return render_template('login.html'), 503
+        
+        # Move the stored hash to the current parameters while we have the
+        # password. This is optional, so a full queue just leaves it for a
+        # later login.
+        if valid and needs_rehash(user['password']):
+            try:
+                new_hash = hash_password(password)
+            except HashingBusy:
+                new_hash = None
+            if new_hash:
+                conn.execute('UPDATE users SET password = ? WHERE id = ?', (new_hash, user['id']))
+                conn.commit()
+                invalidate_user(user['id'])
+        
+        if valid:
             user_obj = User(user['id'], user['username'])
             login_user(user_obj)
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('.dashboard'))
         else:
             flash('Invalid username or password', 'error')
     
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     """Registration page"""
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         
-        conn = get_db_connection()
+        conn = get_db()
         
         # Check if user already exists
         existing_user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
         if existing_user:
             flash('Username already exists', 'error')
-            conn.close()
             return render_template('register.html')
         
         # Create new user
-        hashed_password = generate_password_hash(password)
+        try:
+            hashed_password = hash_password(password)
+        except HashingBusy:
+            flash('The server is busy, please try again in a moment', 'error')
+            return render_template('register.html'), 503
         conn.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, hashed_password))
         conn.commit()
-        conn.close()
         
         flash('Registration successful! Please log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
     return render_template('register.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     """Logout"""
+    invalidate_user(current_user.id)
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(url_for('.login'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def dashboard():
     """Main dashboard showing all classes"""
-    conn = get_db_connection()
+    conn = get_db()
+    classes = conn.execute(
+        '''SELECT c.id, COALESCE(v.version, 0) AS version
+           FROM classes c LEFT JOIN class_versions v ON v.class_id = c.id
+           WHERE c.user_id = ?
+           ORDER BY c.created_at DESC, c.id DESC''',
+        (current_user.id,)
+    ).fetchall()
+    
+    # Cards and the GPA are cached per class version; grades are only
+    # computed, all in one query, if something has to be rendered again
+    results = None
+    def bulk_results():
+        nonlocal results
+        if results is None:
+            results = {r['class_info']['id']: r for r in calculate_grades_bulk(current_user.id)}
+        return results
+    
+    def card_context(class_id):
+        result = bulk_results()[class_id]
+        return {'class': result['class_info'], 'grade_info': result['grade_info']}
+    
+    cards = {
+        class_info['id']: render_fragment('card', class_info, 'class_card.html',
+                                          lambda class_id=class_info['id']: card_context(class_id))
+        for class_info in classes
+    }
+    
+    gpa = get_user_gpa(classes, lambda: bulk_results().values()) if classes else None
+    
+    return render_template('dashboard.html', classes=classes, cards=cards, gpa=gpa)
+
+def get_user_gpa(class_versions, get_results):
+    """The current user's GPA, reused until any of their classes changes
+    
+    Args:
+        class_versions: Rows of (id, version) for all of the user's classes
+        get_results: Callable returning calculate_grades_bulk results, only
+            called on a cache miss
+    """
+    key = (current_user.id, tuple(sorted((row[0], row[1]) for row in class_versions)))
+    gpa_cache = get_caches().gpa
+    gpa = gpa_cache.get(key)
+    if gpa is None:
+        gpa = compute_gpa(get_results())
+        gpa_cache.set(key, gpa)
+    return gpa
+
+@bp.route('/api/gpa')
+@login_required
+def api_gpa():
+    """JSON weighted and unweighted GPA overall, per term and per class"""
+    conn = get_db()
     classes = conn.execute(
-        'SELECT * FROM classes WHERE user_id = ? ORDER BY created_at DESC',
+        '''SELECT c.id, COALESCE(v.version, 0) AS version
+           FROM classes c LEFT JOIN class_versions v ON v.class_id = c.id
+           WHERE c.user_id = ?''',
         (current_user.id,)
     ).fetchall()
-    conn.close()
+    return jsonify(get_user_gpa(classes, lambda: calculate_grades_bulk(current_user.id, conn)))
+
+@bp.route('/api/grades')
+@login_required
+def api_grades():
+    """JSON grades for all of the current user's classes"""
+    results = calculate_grades_bulk(current_user.id)
+    return jsonify({
+        'classes': [
+            dict(result['class_info'], **result['grade_info'])
+            for result in results
+        ]
+    })
+
+@bp.route('/export.<fmt>')
+@login_required
+def export_grades(fmt):
+    """Stream all of the current user's grades (or everyone's, for admins) as CSV or NDJSON"""
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown export format "{fmt}"'}), 404
+    
+    user_id = current_user.id
+    if request.args.get('all') == '1':
+        if current_user.username not in EXPORT_ADMINS:
+            return jsonify({'error': 'Only admins can export every user'}), 403
+        user_id = None
+    compress = request.args.get('gzip') == '1'
     
-    return render_template('dashboard.html', classes=classes)
+    filename = f'grades.{fmt}' + ('.gz' if compress else '')
+    chunks = stream_export(get_db(), fmt, user_id, compress)
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/gzip' if compress else EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
-@app.route('/add_class', methods=['GET', 'POST'])
+@bp.route('/add_class', methods=['GET', 'POST'])
 @login_required
 def add_class():
     """Create a new class with manual grade entry"""
@@ -117,83 +274,574 @@ def add_class():
         
         if not class_name:
             flash('Please enter a class name', 'error')
-            return redirect(url_for('add_class'))
-            
-        # Create a new class with default category
-        conn = get_db_connection()
+            return redirect(url_for('.add_class'))
+        
         try:
-            conn.execute(
-                'INSERT INTO classes (user_id, class_name, teacher_name) VALUES (?, ?, ?)',
-                (current_user.id, class_name, teacher_name)
-            )
-            class_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            term, level, credits, grade_scale = read_gpa_settings(request.form)
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('.add_class'))
             
-            # Add default category
-            conn.execute(
-                'INSERT INTO categories (class_id, name, weight) VALUES (?, ?, ?)',
-                (class_id, 'Assignments', 100.0)
-            )
-            conn.commit()
-            flash(f'Class "{class_name}" created successfully!', 'success')
-            return redirect(url_for('view_class', class_id=class_id))
-        finally:
-            conn.close()
-    
-    return render_template('add_class.html')
-
-@app.route('/class/<int:class_id>')
+        # Create a new class with default category
+        conn = get_db()
+        conn.execute(
+            'INSERT INTO classes (user_id, class_name, teacher_name, term, level, credits, grade_scale) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (current_user.id, class_name, teacher_name, term, level, credits, grade_scale)
+        )
+        class_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        
+        # Add default category
+        conn.execute(
+            'INSERT INTO categories (class_id, name, weight) VALUES (?, ?, ?)',
+            (class_id, 'Assignments', 100.0)
+        )
+        conn.commit()
+        flash(f'Class "{class_name}" created successfully!', 'success')
+        return redirect(url_for('.view_class', class_id=class_id))
+    
+    return render_template('add_class.html', levels=LEVELS)
+
+def read_gpa_settings(form):
+    """(term, level, credits, grade scale JSON) from a class form
+    
+    Raises:
+        ValueError: with a message for the user if a field is invalid
+    """
+    term = form.get('term', '').strip() or None
+    level = form.get('level', 'regular')
+    if level not in LEVELS:
+        raise ValueError('Please choose a valid class level')
+    try:
+        credits = float(form.get('credits') or 1)
+    except ValueError:
+        raise ValueError('Credits must be a number')
+    if credits < 0:
+        raise ValueError('Credits must not be negative')
+    grade_scale = cutoffs_to_json(cutoffs_from_text(form.get('grade_scale', '')))
+    return term, level, credits, grade_scale
+
+@bp.route('/class/<int:class_id>/settings', methods=['POST'])
 @login_required
-def view_class(class_id):
-    """View a specific class with all assignments and calculated grade"""
-    conn = get_db_connection()
+def class_settings(class_id):
+    """Update a class's term, level, credits and letter-grade cutoffs"""
+    conn = get_db()
     
-    # Get class info
     class_info = conn.execute(
-        'SELECT * FROM classes WHERE id = ? AND user_id = ?',
+        'SELECT id FROM classes WHERE id = ? AND user_id = ?',
         (class_id, current_user.id)
     ).fetchone()
+    if not class_info:
+        flash('Class not found', 'error')
+        return redirect(url_for('.dashboard'))
+    
+    try:
+        term, level, credits, grade_scale = read_gpa_settings(request.form)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('.view_class', class_id=class_id))
+    
+    conn.execute(
+        'UPDATE classes SET term = ?, level = ?, credits = ?, grade_scale = ? WHERE id = ?',
+        (term, level, credits, grade_scale, class_id)
+    )
+    conn.commit()
+    get_caches().fragments.invalidate_class(class_id)
+    flash('Class settings saved', 'success')
+    return redirect(url_for('.view_class', class_id=class_id))
+
+@bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_grades():
+    """Paste an Aeries gradebook and review the parsed assignments
+    
+    Choosing an existing class re-imports into it instead of creating one.
+    """
+    conn = get_db()
+    classes = conn.execute(
+        'SELECT id, class_name FROM classes WHERE user_id = ? ORDER BY class_name, id',
+        (current_user.id,)
+    ).fetchall()
+    
+    if request.method == 'POST':
+        class_name = request.form.get('class_name', '').strip()
+        teacher_name = request.form.get('teacher_name', '').strip()
+        target = None
+        class_id = request.form.get('class_id', type=int)
+        if class_id:
+            target = next((c for c in classes if c['id'] == class_id), None)
+            if target is None:
+                flash('Class not found', 'error')
+                return render_template('import.html', classes=classes)
+        
+        parsed = parse_aeries_grades(request.form.get('aeries_text', ''))
+        if not parsed['assignments']:
+            flash('No assignments were found in the pasted text', 'error')
+            return render_template('import.html', classes=classes)
+        
+        return render_template('import_preview.html',
+                             class_name=target['class_name'] if target else class_name,
+                             teacher_name=teacher_name,
+                             target=target,
+                             assignments=parsed['assignments'],
+                             categories=parsed['categories'])
     
+    return render_template('import.html', classes=classes)
+
+@bp.route('/import/commit', methods=['POST'])
+@login_required
+def commit_import():
+    """Save the reviewed assignments as a new class in one transaction
+    
+    With a class_id, update that class to match instead (see commit_reimport).
+    """
+    class_name = request.form.get('class_name', '').strip()
+    teacher_name = request.form.get('teacher_name', '').strip()
+    weights = read_category_weights(request.form)
+    
+    errors = []
+    rows = list(validate_rows(read_import_form(request.form), errors))
+    
+    class_id = request.form.get('class_id', type=int)
+    if class_id and not errors:
+        return commit_reimport(class_id, weights, rows)
+    
+    target = None
+    if class_id:
+        target = get_db().execute(
+            'SELECT id, class_name FROM classes WHERE id = ? AND user_id = ?',
+            (class_id, current_user.id)
+        ).fetchone()
+    
+    if not class_name and not target:
+        flash('Please enter a class name', 'error')
+        return redirect(url_for('.import_grades'))
+    
+    if errors:
+        flash(f'{len(errors)} assignment(s) need fixing before they can be saved', 'error')
+        return render_template('import_preview.html',
+                             class_name=class_name,
+                             teacher_name=teacher_name,
+                             target=target,
+                             assignments=rows,
+                             categories=weights)
+    
+    conn = get_db()
+    try:
+        result = write_import(conn, current_user.id, class_name, teacher_name, weights, rows)
+    except sqlite3.Error:
+        flash('An error occurred while importing. Nothing was saved.', 'error')
+        return redirect(url_for('.import_grades'))
+    
+    flash(f'Imported {result["count"]} assignments into "{class_name}" '
+          f'({result["rows_per_second"]:,.0f} rows/s)', 'success')
+    return redirect(url_for('.view_class', class_id=result['class_id']))
+
+def commit_reimport(class_id, weights, rows):
+    """Apply only the differences between the reviewed rows and an existing class"""
+    conn = get_db()
+    class_info = conn.execute(
+        'SELECT id, class_name FROM classes WHERE id = ? AND user_id = ?',
+        (class_id, current_user.id)
+    ).fetchone()
     if not class_info:
         flash('Class not found', 'error')
-        conn.close()
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('.import_grades'))
+    
+    try:
+        result = reimport(conn, class_id, weights, rows,
+                          delete_missing=not request.form.get('keep_missing'))
+    except sqlite3.Error:
+        flash('An error occurred while importing. Nothing was changed.', 'error')
+        return redirect(url_for('.import_grades'))
+    
+    if result['inserted'] or result['updated'] or result['deleted']:
+        get_caches().fragments.invalidate_class(class_id)
+    flash(f'Updated "{class_info["class_name"]}": {result["inserted"]} added, '
+          f'{result["updated"]} changed, {result["deleted"]} removed, '
+          f'{result["unchanged"]} unchanged', 'success')
+    return redirect(url_for('.view_class', class_id=class_id))
+
+def render_fragment(kind, class_info, template, get_context):
+    """Render part of a class's page, reusing the copy cached for its version
+    
+    get_context is only called on a cache miss, so cached fragments skip
+    their queries as well as the template.
+    """
+    key = (kind, class_info['id'], class_info['version'])
+    fragment_cache = get_caches().fragments
+    html = fragment_cache.get(key)
+    if html is None:
+        html = render_template(template, **get_context())
+        fragment_cache.set(key, html)
+    return Markup(html)
+
+def read_page_args():
+    """Keyset cursor and page size from the query string"""
+    after_category = request.args.get('after_category')
+    after_id = request.args.get('after_id', type=int)
+    after = (after_category, after_id) if after_category is not None and after_id is not None else None
+    per_page = request.args.get('per_page', ASSIGNMENTS_PER_PAGE, type=int)
+    per_page = max(1, min(per_page, MAX_ASSIGNMENTS_PER_PAGE))
+    return after, per_page
+
+def get_assignment_page(conn, class_id, after=None, limit=ASSIGNMENTS_PER_PAGE, columns='a.*'):
+    """One page of a class's assignments in (category name, id) order
     
-    # Get categories
+    Uses keyset pagination, so later pages cost the same as the first and
+    only one page of rows is ever held in memory. The class's categories are
+    read in (name, id) order from idx_categories_class_name, then each
+    category's assignments in id order from idx_assignments_class_category
+    until the page is full, so no query has to sort. Categories that share a
+    name are listed one after the other.
+    
+    Returns:
+        (rows, next_cursor) where next_cursor is the (category name, id) to
+        pass as `after` for the following page, or None on the last page
+    """
     categories = conn.execute(
-        'SELECT * FROM categories WHERE class_id = ?',
+        'SELECT id, name FROM categories WHERE class_id = ? ORDER BY name, id',
         (class_id,)
     ).fetchall()
     
-    # Get assignments grouped by category
-    assignments = conn.execute(
-        'SELECT a.*, c.name as category_name FROM assignments a JOIN categories c ON a.category_id = c.id WHERE a.class_id = ? ORDER BY c.name, a.id',
-        (class_id,)
-    ).fetchall()
+    after_category = None
+    if after:
+        # The category the cursor's assignment is in; earlier categories with
+        # the same name are done. If it has moved or gone, fall back to
+        # filtering every category of that name by id.
+        row = conn.execute(
+            'SELECT a.category_id FROM assignments a JOIN categories c ON c.id = a.category_id WHERE a.id = ? AND a.class_id = ? AND c.name = ?',
+            (after[1], class_id, after[0])
+        ).fetchone()
+        after_category = row[0] if row else None
     
-    conn.close()
+    rows = []
+    for category_id, name in categories:
+        min_id = 0
+        if after:
+            if name < after[0]:
+                continue
+            if name == after[0]:
+                if after_category is not None and category_id < after_category:
+                    continue
+                if after_category is None or category_id == after_category:
+                    min_id = after[1]
+        rows += conn.execute(
+            f'SELECT {columns}, ? AS category_name FROM assignments a WHERE a.class_id = ? AND a.category_id = ? AND a.id > ? ORDER BY a.id LIMIT ?',
+            (name, class_id, category_id, min_id, limit + 1 - len(rows))
+        ).fetchall()
+        if len(rows) > limit:
+            break
     
-    # Convert to dictionaries for calculation
-    categories_dict = {cat['name']: cat['weight'] for cat in categories}
-    assignments_list = [dict(assignment) for assignment in assignments]
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1]['category_name'], rows[-1]['id'])
+    return rows, None
+
+def assignment_page_context(conn, class_id, after, per_page):
+    assignments, next_page = get_assignment_page(conn, class_id, after, per_page)
+    return {'assignments': assignments, 'next_page': next_page,
+            'class_id': class_id, 'after': after, 'per_page': per_page}
+
+def get_versioned_class(conn, class_id):
+    """Get the current user's class along with its data version, or None"""
+    return conn.execute(
+        '''SELECT c.*, COALESCE(v.version, 0) AS version
+           FROM classes c LEFT JOIN class_versions v ON v.class_id = c.id
+           WHERE c.id = ? AND c.user_id = ?''',
+        (class_id, current_user.id)
+    ).fetchone()
+
+def cursor_digest(after):
+    """Short digest of a page cursor for ETags (the cursor is user input)"""
+    return hashlib.sha1(repr(after).encode()).hexdigest()[:16]
+
+def class_etag(class_info, kind):
+    """Strong ETag for a class's data version as seen by the current user"""
+    return f'{kind}-{class_info["id"]}-v{class_info["version"]}-u{current_user.id}'
+
+def not_modified(etag):
+    """Answer a matching If-None-Match without rendering anything"""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def with_etag(response, etag):
+    response = make_response(response)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/class/<int:class_id>')
+@login_required
+def view_class(class_id):
+    """View a specific class with all assignments and calculated grade"""
+    conn = get_db()
     
-    # Rename category field for calculation
-    for assignment in assignments_list:
-        assignment['category'] = assignment['category_name']
+    # Get class info
+    class_info = get_versioned_class(conn, class_id)
     
-    # Calculate grade
-    grade_info = calculate_grade(assignments_list, categories_dict)
+    if not class_info:
+        flash('Class not found', 'error')
+        return redirect(url_for('.dashboard'))
+    
+    # Take the flash messages now: the session cookie is saved before the
+    # streamed body runs, so messages read while streaming would never be
+    # removed. base.html gets these same messages back from the request.
+    # Pages showing messages aren't cached.
+    messages = get_flashed_messages()
+    after, per_page = read_page_args()
+    etag = None if messages else class_etag(class_info, f'class-{per_page}-{cursor_digest(after)}')
+    if etag and request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    # Grade summary from the per-category totals kept up to date on write
+    grade_summary = render_fragment(
+        'summary', class_info, 'grade_summary.html',
+        lambda: {'grade_info': get_class_grade(conn, class_id)}
+    )
+    
+    # One page of assignments, rendered only once the summary has been sent
+    def assignments_table():
+        return render_fragment(
+            f'assignments:{per_page}:{after}', class_info, 'assignments_table.html',
+            lambda: assignment_page_context(conn, class_id, after, per_page)
+        )
     
-    return render_template('class_view.html', 
+    page = stream_template('class_view.html', 
                          class_info=class_info, 
-                         categories=categories,
-                         assignments=assignments,
-                         grade_info=grade_info)
+                         levels=LEVELS,
+                         grade_scale=cutoffs_to_text(parse_cutoffs(class_info['grade_scale'])), 
+                         grade_summary=grade_summary,
+                         assignments_table=assignments_table)
+    return with_etag(page, etag) if etag else page
+
+@bp.route('/api/class/<int:class_id>')
+@login_required
+def api_class(class_id):
+    """JSON grade summary and one page of assignments for a class, with ETag support
+    
+    Pass the returned "next" cursor as after_category/after_id for the next page.
+    """
+    conn = get_db()
+    
+    class_info = get_versioned_class(conn, class_id)
+    if not class_info:
+        return jsonify({'error': 'Class not found'}), 404
+    
+    after, per_page = read_page_args()
+    etag = class_etag(class_info, f'api-class-{per_page}-{cursor_digest(after)}')
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    assignments, next_page = get_assignment_page(
+        conn, class_id, after, per_page,
+        columns='a.id, a.description, a.points_earned, a.points_possible, a.comment, a.version'
+    )
+    
+    return with_etag(jsonify({
+        'id': class_info['id'],
+        'class_name': class_info['class_name'],
+        'teacher_name': class_info['teacher_name'],
+        'version': class_info['version'],
+        'grade': get_class_grade(conn, class_id),
+        'assignments': [dict(assignment) for assignment in assignments],
+        'next': {'after_category': next_page[0], 'after_id': next_page[1]} if next_page else None,
+    }), etag)
+
+def read_timeline_args(default_by):
+    """Bucket and optional max_points for a timeline request"""
+    by = request.args.get('by', default_by)
+    max_points = request.args.get('max_points', 0, type=int)
+    return by, max(0, max_points)
+
+@bp.route('/api/class/<int:class_id>/timeline')
+@login_required
+def api_class_timeline(class_id):
+    """JSON grade-over-time series for a class
+    
+    ?by=assignment|day|week picks the points; ?max_points=N downsamples for charts.
+    """
+    conn = get_db()
+    
+    class_info = get_versioned_class(conn, class_id)
+    if not class_info:
+        return jsonify({'error': 'Class not found'}), 404
+    
+    by, max_points = read_timeline_args('assignment')
+    if by not in TIMELINE_BUCKETS:
+        return jsonify({'error': f'by must be one of {", ".join(TIMELINE_BUCKETS)}'}), 400
+    
+    kind = f'timeline-{by}-{max_points}'
+    etag = class_etag(class_info, kind)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    # The series only changes with the class's data version
+    key = (kind, class_id, class_info['version'])
+    fragment_cache = get_caches().fragments
+    body = fragment_cache.get(key)
+    if body is None:
+        timeline = class_timeline(conn, class_id, by)
+        body = json.dumps({
+            'id': class_id,
+            'version': class_info['version'],
+            'by': by,
+            'points': downsample(timeline['points'], max_points),
+            'total_points': len(timeline['points']),
+            'undated': timeline['undated'],
+        })
+        fragment_cache.set(key, body)
+    return with_etag(current_app.response_class(body, mimetype='application/json'), etag)
+
+@bp.route('/api/timeline')
+@login_required
+def api_gpa_timeline():
+    """JSON GPA-over-time series across all of the current user's classes
+    
+    ?by=day|week picks the points; ?max_points=N downsamples for charts.
+    """
+    by, max_points = read_timeline_args('day')
+    if by not in ('day', 'week'):
+        return jsonify({'error': 'by must be day or week'}), 400
+    
+    conn = get_db()
+    versions = tuple(conn.execute(
+        '''SELECT c.id, COALESCE(v.version, 0)
+           FROM classes c LEFT JOIN class_versions v ON v.class_id = c.id
+           WHERE c.user_id = ? ORDER BY c.id''',
+        (current_user.id,)
+    ).fetchall())
+    key = (current_user.id, by, max_points, tuple(tuple(row) for row in versions))
+    
+    gpa_timeline_cache = get_caches().gpa_timelines
+    result = gpa_timeline_cache.get(key)
+    if result is None:
+        timeline = user_gpa_timeline(conn, current_user.id, by)
+        result = {
+            'by': by,
+            'points': downsample(timeline['points'], max_points, key='gpa'),
+            'total_points': len(timeline['points']),
+            'undated': timeline['undated'],
+        }
+        gpa_timeline_cache.set(key, result)
+    return jsonify(result)
 
-@app.route('/class/<int:class_id>/add_assignment', methods=['GET', 'POST'])
+@bp.route('/class/<int:class_id>/what_if', methods=['POST'])
+@login_required
+def what_if(class_id):
+    """Evaluate hypothetical scores for a class without saving anything
+    
+    Expects JSON: {"changes": [...], "grid_step": 10, "targets": [90, 80]}.
+    A change with an "assignment_id" edits that assignment; any other change
+    adds a hypothetical assignment. Leave out "points_earned" to solve for it.
+    """
+    conn = get_db()
+    
+    # Verify class belongs to user
+    class_info = conn.execute(
+        'SELECT * FROM classes WHERE id = ? AND user_id = ?',
+        (class_id, current_user.id)
+    ).fetchone()
+    
+    if not class_info:
+        return jsonify({'error': 'Class not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    if not isinstance(data.get('changes', []), list) or not isinstance(data.get('targets', []), list):
+        return jsonify({'error': 'changes and targets must be lists'}), 400
+    
+    changes = []
+    for change in data.get('changes', []):
+        if not isinstance(change, dict):
+            return jsonify({'error': 'Each change must be an object'}), 400
+        change = dict(change)
+        assignment_id = change.pop('assignment_id', None)
+        if assignment_id is not None:
+            if not isinstance(assignment_id, int) or isinstance(assignment_id, bool):
+                return jsonify({'error': 'assignment_id must be an integer'}), 400
+            existing = conn.execute(
+                'SELECT a.*, c.name AS category_name FROM assignments a JOIN categories c ON a.category_id = c.id WHERE a.id = ? AND a.class_id = ?',
+                (assignment_id, class_id)
+            ).fetchone()
+            if not existing:
+                return jsonify({'error': f'Assignment {assignment_id} not found'}), 404
+            change['replaces'] = {
+                'category': existing['category_name'],
+                'points_earned': existing['points_earned'],
+                'points_possible': existing['points_possible'],
+            }
+            change.setdefault('category', existing['category_name'])
+            change.setdefault('points_possible', existing['points_possible'])
+            change.setdefault('description', existing['description'])
+        changes.append(change)
+    
+    try:
+        result = solve_what_if(
+            get_category_rows(conn, class_id),
+            changes,
+            grid_step=data.get('grid_step'),
+            targets=data.get('targets', []),
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(result)
+
+@bp.route('/class/<int:class_id>/assignments/batch', methods=['POST'])
+@login_required
+def batch_assignments(class_id):
+    """Create, update and delete many assignments in one transaction
+    
+    Expects JSON: {"operations": [{"op": "create" | "update" | "delete", ...}]}
+    (see batch.py). Updates and deletes carry the row version they last saw;
+    if any has changed, nothing is written and the response is a 409.
+    """
+    conn = get_db()
+    
+    # Verify class belongs to user
+    class_info = conn.execute(
+        'SELECT id FROM classes WHERE id = ? AND user_id = ?',
+        (class_id, current_user.id)
+    ).fetchone()
+    if not class_info:
+        return jsonify({'error': 'Class not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    category_ids = {row[0] for row in conn.execute('SELECT id FROM categories WHERE class_id = ?', (class_id,))}
+    try:
+        creates, updates, deletes = validate_operations(data.get('operations'), category_ids)
+        result = apply_batch(conn, class_id, creates, updates, deletes)
+    except BatchError as e:
+        return jsonify({'error': 'Invalid operations', 'errors': e.errors}), 400
+    except BatchConflict as e:
+        return jsonify({'error': str(e), 'conflicts': e.conflicts}), 409
+    except sqlite3.Error:
+        return jsonify({'error': 'An error occurred while saving. Nothing was changed.'}), 500
+    get_caches().fragments.invalidate_class(class_id)
+    
+    class_info = get_versioned_class(conn, class_id)
+    result.update(version=class_info['version'], grade=get_class_grade(conn, class_id))
+    return jsonify(result)
+
+def class_has_category(conn, class_id, category_id):
+    """True if category_id is one of the class's categories"""
+    return conn.execute(
+        'SELECT 1 FROM categories WHERE id = ? AND class_id = ?',
+        (category_id, class_id)
+    ).fetchone() is not None
+
+@bp.route('/class/<int:class_id>/add_assignment', methods=['GET', 'POST'])
 @login_required
 def add_assignment(class_id):
     """Add a new assignment to a class"""
-    conn = get_db_connection()
+    conn = get_db()
     
     # Verify class belongs to user
     class_info = conn.execute(
@@ -203,8 +851,7 @@ def add_assignment(class_id):
     
     if not class_info:
         flash('Class not found', 'error')
-        conn.close()
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('.dashboard'))
     
     if request.method == 'POST':
         description = request.form.get('description')
@@ -213,6 +860,10 @@ def add_assignment(class_id):
         points_possible = request.form.get('points_possible')
         comment = request.form.get('comment', '')
         
+        if not class_has_category(conn, class_id, category_id):
+            flash('Please choose one of this class\'s categories', 'error')
+            return redirect(url_for('.add_assignment', class_id=class_id))
+        
         # Convert empty string to None for points_earned
         points_earned = float(points_earned) if points_earned else None
         
@@ -221,25 +872,24 @@ def add_assignment(class_id):
             (class_id, category_id, description, points_earned, float(points_possible), comment)
         )
         conn.commit()
-        conn.close()
+        get_caches().fragments.invalidate_class(class_id)
         
         flash('Assignment added successfully!', 'success')
-        return redirect(url_for('view_class', class_id=class_id))
+        return redirect(url_for('.view_class', class_id=class_id))
     
     # Get categories for the form
     categories = conn.execute(
         'SELECT * FROM categories WHERE class_id = ?',
         (class_id,)
     ).fetchall()
-    conn.close()
     
     return render_template('add_assignment.html', class_info=class_info, categories=categories)
 
-@app.route('/assignment/<int:assignment_id>/edit', methods=['GET', 'POST'])
+@bp.route('/assignment/<int:assignment_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_assignment(assignment_id):
     """Edit an existing assignment"""
-    conn = get_db_connection()
+    conn = get_db()
     
     # Get assignment and verify user owns it
     assignment = conn.execute(
@@ -249,8 +899,7 @@ def edit_assignment(assignment_id):
     
     if not assignment or assignment['user_id'] != current_user.id:
         flash('Assignment not found', 'error')
-        conn.close()
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('.dashboard'))
     
     if request.method == 'POST':
         description = request.form.get('description')
@@ -259,33 +908,36 @@ def edit_assignment(assignment_id):
         points_possible = request.form.get('points_possible')
         comment = request.form.get('comment', '')
         
+        if not class_has_category(conn, assignment['class_id'], category_id):
+            flash('Please choose one of this class\'s categories', 'error')
+            return redirect(url_for('.edit_assignment', assignment_id=assignment_id))
+        
         # Convert empty string to None for points_earned
         points_earned = float(points_earned) if points_earned else None
         
         conn.execute(
-            'UPDATE assignments SET description = ?, category_id = ?, points_earned = ?, points_possible = ?, comment = ? WHERE id = ?',
+            'UPDATE assignments SET description = ?, category_id = ?, points_earned = ?, points_possible = ?, comment = ?, version = version + 1 WHERE id = ?',
             (description, category_id, points_earned, float(points_possible), comment, assignment_id)
         )
         conn.commit()
-        conn.close()
+        get_caches().fragments.invalidate_class(assignment['class_id'])
         
         flash('Assignment updated successfully!', 'success')
-        return redirect(url_for('view_class', class_id=assignment['class_id']))
+        return redirect(url_for('.view_class', class_id=assignment['class_id']))
     
     # Get categories for the form
     categories = conn.execute(
         'SELECT * FROM categories WHERE class_id = ?',
         (assignment['class_id'],)
     ).fetchall()
-    conn.close()
     
     return render_template('edit_assignment.html', assignment=assignment, categories=categories)
 
-@app.route('/assignment/<int:assignment_id>/delete', methods=['POST'])
+@bp.route('/assignment/<int:assignment_id>/delete', methods=['POST'])
 @login_required
 def delete_assignment(assignment_id):
     """Delete an assignment"""
-    conn = get_db_connection()
+    conn = get_db()
     
     # Get assignment and verify user owns it
     assignment = conn.execute(
@@ -295,24 +947,23 @@ def delete_assignment(assignment_id):
     
     if not assignment or assignment['user_id'] != current_user.id:
         flash('Assignment not found', 'error')
-        conn.close()
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('.dashboard'))
     
     class_id = assignment['class_id']
     
     conn.execute('DELETE FROM assignments WHERE id = ?', (assignment_id,))
     conn.commit()
-    conn.close()
+    get_caches().fragments.invalidate_class(class_id)
     
     flash('Assignment deleted successfully!', 'success')
-    return redirect(url_for('view_class', class_id=class_id))
+    return redirect(url_for('.view_class', class_id=class_id))
 
 
-@app.route('/class/<int:class_id>/delete', methods=['POST'])
+@bp.route('/class/<int:class_id>/delete', methods=['POST'])
 @login_required
 def delete_class(class_id):
     """Delete a class and all its assignments and categories"""
-    conn = get_db_connection()
+    conn = get_db()
     
     # First verify the class exists and belongs to the current user
     class_info = conn.execute(
@@ -322,8 +973,7 @@ def delete_class(class_id):
     
     if not class_info:
         flash('Class not found or you do not have permission to delete it', 'error')
-        conn.close()
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('.dashboard'))
     
     try:
         # Delete all assignments for this class (cascading delete should handle this, but being explicit)
@@ -334,14 +984,81 @@ def delete_class(class_id):
         conn.execute('DELETE FROM classes WHERE id = ?', (class_id,))
         
         conn.commit()
+        get_caches().fragments.invalidate_class(class_id)
         flash(f'Class "{class_info["class_name"]}" and all its data have been deleted.', 'success')
     except Exception as e:
         conn.rollback()
         flash('An error occurred while deleting the class.', 'error')
-    finally:
-        conn.close()
     
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('.dashboard'))
+
+@bp.route('/cache/stats')
+@login_required
+def cache_stats():
+    """Hit rates and memory use of the in-process caches"""
+    caches = get_caches()
+    return jsonify({
+        'fragments': caches.fragments.stats(),
+        'users': caches.users.stats(),
+        'gpa_timelines': caches.gpa_timelines.stats(),
+        'gpa': caches.gpa.stats(),
+    })
+
+def create_app(overrides=None):
+    """Build the Flask app
+    
+    Configuration comes from the environment (see config.py), then from
+    `overrides`. Nothing touches the database until the first request;
+    create or upgrade the schema with `flask --app app init-db`.
+    """
+    app = Flask(__name__)
+    app.config.update(config.from_env(app.instance_path))
+    app.config.update(overrides or {})
+    
+    # Compiled templates are kept on disk, so a restarted worker loads
+    # bytecode instead of parsing and compiling every template again
+    cache_dir = app.config['TEMPLATE_CACHE_DIR']
+    if cache_dir is None:
+        cache_dir = os.path.join(app.instance_path, 'jinja_cache')
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(cache_dir))
+    
+    login_manager.init_app(app)
+    app.extensions['grades_caches'] = AppCaches()
+    
+    # Release the pooled database connection after every request
+    app.teardown_appcontext(close_db)
+    
+    # Request and SQL metrics at /metrics (GRADES_METRICS=0 turns them off)
+    metrics.init_app(app)
+    
+    app.register_blueprint(bp)
+    
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create the database tables and apply pending migrations."""
+        init_db(app.config['DATABASE'])
+    
+    @app.cli.command('compile-templates')
+    def compile_templates_command():
+        """Compile every template into the bytecode cache."""
+        names = app.jinja_env.list_templates(extensions=['html'])
+        for name in names:
+            app.jinja_env.get_template(name)
+        print(f"Compiled {len(names)} templates")
+    
+    return app
+
+def __getattr__(name):
+    # `app:app` and `from app import app` still work; the app is built on
+    # first access instead of as a side effect of importing this module
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app = create_app()
+    init_db(app.config['DATABASE'])
+    app.run(debug=True)
@@ -0,0 +1,227 @@
+"""
+Batch create/update/delete of a class's assignments.
+
+A batch is a list of operations:
+
+    {"op": "create", "description": ..., "category_id": ..., "points_possible": ...,
+     "points_earned": ..., "comment": ..., "date_completed": ..., "due_date": ...}
+    {"op": "update", "id": ..., "version": ..., <any fields to change>}
+    {"op": "delete", "id": ..., "version": ...}
+
+Every assignment row carries a version that goes up on each update. Updates
+and deletes must send the version they last saw; if any row has moved on,
+the whole batch is rejected with the conflicts and nothing is written.
+"""
+import time
+
+# Largest batch accepted in one request
+MAX_OPERATIONS = 1000
+
+FIELDS = ('description', 'category_id', 'points_earned', 'points_possible',
+          'comment', 'date_completed', 'due_date')
+
+
+class BatchError(Exception):
+    """A batch that can't be applied; `errors` is a list of {'index', 'error'}"""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f'operation {e["index"]}: {e["error"]}' for e in errors))
+        self.errors = errors
+
+
+class BatchConflict(Exception):
+    """Rows changed since the client read them; `conflicts` lists id, expected and actual versions"""
+
+    def __init__(self, conflicts):
+        super().__init__(f'{len(conflicts)} assignment(s) were changed by someone else')
+        self.conflicts = conflicts
+
+
+def _is_int(value):
+    # JSON true/false decode to bools, which are ints in Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _check_fields(operation, category_ids, problems):
+    """Convert and check the assignment fields present in an operation"""
+    values = {}
+    for field in ('description', 'comment', 'date_completed', 'due_date'):
+        if field in operation and not isinstance(operation[field], (str, type(None))):
+            problems.append(f'{field} must be a string or null')
+            return values
+    if 'description' in operation:
+        values['description'] = (operation['description'] or '').strip()
+        if not values['description']:
+            problems.append('description must not be empty')
+    if 'category_id' in operation:
+        values['category_id'] = operation['category_id']
+        if not _is_int(values['category_id']):
+            problems.append('category_id must be an integer')
+        elif values['category_id'] not in category_ids:
+            problems.append(f'category {values["category_id"]} is not in this class')
+    if 'points_possible' in operation:
+        try:
+            values['points_possible'] = float(operation['points_possible'])
+            if values['points_possible'] <= 0:
+                problems.append('points_possible must be greater than 0')
+        except (TypeError, ValueError):
+            problems.append('points_possible is not a number')
+    if 'points_earned' in operation:
+        earned = operation['points_earned']
+        try:
+            values['points_earned'] = float(earned) if earned not in (None, '') else None
+        except (TypeError, ValueError):
+            problems.append('points_earned is not a number')
+    if 'comment' in operation:
+        values['comment'] = operation['comment'] or ''
+    for field in ('date_completed', 'due_date'):
+        if field in operation:
+            values[field] = operation[field] or None
+    return values
+
+
+def validate_operations(operations, category_ids):
+    """
+    Split a batch into creates, updates and deletes, checking every operation.
+
+    Args:
+        operations: The decoded JSON list
+        category_ids: Set of the class's category ids
+
+    Returns:
+        (creates, updates, deletes): creates are field dicts; updates are
+        (id, version, field dict); deletes are (id, version)
+
+    Raises:
+        BatchError: listing every invalid operation
+    """
+    if not isinstance(operations, list) or not operations:
+        raise BatchError([{'index': None, 'error': 'operations must be a non-empty list'}])
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError([{'index': None, 'error': f'at most {MAX_OPERATIONS} operations per batch'}])
+
+    creates, updates, deletes = [], [], []
+    errors = []
+    seen = set()
+    for index, operation in enumerate(operations):
+        problems = []
+        if not isinstance(operation, dict):
+            errors.append({'index': index, 'error': 'operation must be an object'})
+            continue
+        op = operation.get('op')
+
+        if op in ('update', 'delete'):
+            assignment_id, version = operation.get('id'), operation.get('version')
+            if not _is_int(assignment_id) or not _is_int(version):
+                problems.append('id and version must be integers')
+            elif assignment_id in seen:
+                problems.append(f'assignment {assignment_id} appears more than once')
+            else:
+                seen.add(assignment_id)
+
+        if op == 'create':
+            values = _check_fields(operation, category_ids, problems)
+            for field in ('description', 'category_id', 'points_possible'):
+                if field not in operation:
+                    problems.append(f'{field} is required')
+            values.setdefault('points_earned', None)
+            values.setdefault('comment', '')
+            values.setdefault('date_completed', None)
+            values.setdefault('due_date', None)
+            creates.append(values)
+        elif op == 'update':
+            values = _check_fields(operation, category_ids, problems)
+            if not values:
+                problems.append('nothing to update')
+            updates.append((operation.get('id'), operation.get('version'), values))
+        elif op == 'delete':
+            deletes.append((operation.get('id'), operation.get('version')))
+        else:
+            problems.append('op must be create, update or delete')
+
+        if problems:
+            errors.append({'index': index, 'error': '; '.join(problems)})
+
+    if errors:
+        raise BatchError(errors)
+    return creates, updates, deletes
+
+
+def apply_batch(conn, class_id, creates, updates, deletes):
+    """
+    Apply validated operations to one class in a single transaction.
+
+    Takes the write lock up front, checks every update/delete version
+    against the stored rows, then writes each kind of operation with one
+    executemany. Nothing is stored if anything fails.
+
+    Returns:
+        Dict with created [{id, version}], updated [{id, version}],
+        deleted [ids] and seconds
+
+    Raises:
+        BatchError: if an id is not an assignment of this class
+        BatchConflict: if a row's version has changed
+    """
+    start = time.perf_counter()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        ids = [assignment_id for assignment_id, _, _ in updates] + [assignment_id for assignment_id, _ in deletes]
+        existing = {}
+        # Stay well under SQLite's bound parameter limit
+        for offset in range(0, len(ids), 500):
+            chunk = ids[offset:offset + 500]
+            for row in conn.execute(
+                f'SELECT id, version, {", ".join(FIELDS)} FROM assignments WHERE class_id = ? AND id IN ({", ".join("?" * len(chunk))})',
+                [class_id] + chunk
+            ):
+                existing[row['id']] = row
+
+        missing = [assignment_id for assignment_id in ids if assignment_id not in existing]
+        if missing:
+            raise BatchError([{'index': None, 'error': f'assignment {assignment_id} not found in this class'}
+                              for assignment_id in missing])
+        conflicts = [
+            {'id': assignment_id, 'expected': version, 'actual': existing[assignment_id]['version']}
+            for assignment_id, version in [(i, v) for i, v, _ in updates] + deletes
+            if existing[assignment_id]['version'] != version
+        ]
+        if conflicts:
+            raise BatchConflict(conflicts)
+
+        if deletes:
+            conn.executemany('DELETE FROM assignments WHERE id = ? AND version = ?', deletes)
+
+        if updates:
+            values = []
+            for assignment_id, version, changes in updates:
+                row = dict(existing[assignment_id])
+                row.update(changes)
+                values.append([row[field] for field in FIELDS] + [assignment_id, version])
+            conn.executemany(
+                f'UPDATE assignments SET {", ".join(f"{field} = ?" for field in FIELDS)}, version = version + 1 WHERE id = ? AND version = ?',
+                values
+            )
+
+        created_ids = []
+        if creates:
+            conn.executemany(
+                f'INSERT INTO assignments (class_id, {", ".join(FIELDS)}) VALUES (?, {", ".join("?" * len(FIELDS))})',
+                [[class_id] + [values[field] for field in FIELDS] for values in creates]
+            )
+            # We hold the write lock, so the new rows got consecutive ids
+            # ending at the last one inserted
+            last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            created_ids = list(range(last_id - len(creates) + 1, last_id + 1))
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {
+        'created': [{'id': assignment_id, 'version': 1} for assignment_id in created_ids],
+        'updated': [{'id': assignment_id, 'version': version + 1} for assignment_id, version, _ in updates],
+        'deleted': [assignment_id for assignment_id, _ in deletes],
+        'seconds': time.perf_counter() - start,
+    }
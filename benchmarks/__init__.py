@@ -0,0 +1,4 @@
+"""Benchmarks for the Aeries grade calculator.
+
+Run a benchmark module directly, e.g. ``python -m benchmarks.bench_parser``.
+"""
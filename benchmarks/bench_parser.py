@@ -0,0 +1,82 @@
+"""
+Micro-benchmark for aeries_parser.parse_aeries_grades.
+
+Builds synthetic Aeries pastes of 100 to 100k rows and reports parse time,
+rows per second and peak memory.
+
+Usage:
+    python -m benchmarks.bench_parser [rows ...]
+"""
+import io
+import random
+import sys
+import time
+import tracemalloc
+
+from aeries_parser import iter_aeries_rows, parse_aeries_grades
+
+CATEGORIES = [('Classwork', 10.0), ('Labs', 30.0), ('Tests & Quizzes', 60.0)]
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+
+
+def make_paste(rows, seed=0):
+    """Build a tab-separated Aeries gradebook paste with `rows` assignments"""
+    rng = random.Random(seed)
+    lines = ['#\tDescription\tCategory\tScore\tCorrect\tPercent\tComment\tDate Completed\tDue Date']
+    for i in range(1, rows + 1):
+        category = CATEGORIES[i % len(CATEGORIES)][0]
+        possible = rng.choice([5, 10, 20, 35, 50, 100])
+        if rng.random() < 0.15:
+            score = f'/ {possible}'
+        else:
+            score = f'{rng.randint(0, possible)} / {possible}'
+        lines.append(f'{i}\tAssignment {i}\t{category}\t{score}\t{score}\t\t\t09/05/2025\t09/05/2025')
+    lines.append('Category\tPerc of Grade\tPoints\tMax\tPerc\tMark')
+    for name, weight in CATEGORIES:
+        lines.append(f'{name}\t{weight:.2f}%\t0\t0\t0%\t')
+    lines.append('Total\t100.00%\t0\t0\t0%\t')
+    return '\n'.join(lines) + '\n'
+
+
+def time_call(func, repeat=5):
+    """Best wall time of `repeat` calls, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(func, *args):
+    """Peak traced allocation while running func(*args), in bytes"""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes=DEFAULT_SIZES):
+    print(f'{"rows":>8} {"parse ms":>10} {"rows/s":>12} {"stream ms":>10} {"stream peak KiB":>16}')
+    for rows in sizes:
+        text = make_paste(rows)
+        repeat = 5 if rows <= 10000 else 2
+
+        parse_s = time_call(lambda: parse_aeries_grades(text), repeat)
+
+        def drain(lines):
+            for _ in iter_aeries_rows(lines):
+                pass
+
+        stream_s = time_call(lambda: drain(io.StringIO(text)), repeat)
+        # Build the line source outside the traced region so the peak only
+        # counts what the parser itself holds on to.
+        peak = peak_memory(drain, io.StringIO(text))
+        print(f'{rows:>8} {parse_s * 1000:>10.2f} {rows / parse_s:>12,.0f} '
+              f'{stream_s * 1000:>10.2f} {peak / 1024:>16.1f}')
+
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
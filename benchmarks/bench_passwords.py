@@ -0,0 +1,67 @@
+"""
+Login throughput benchmark for the password hashing pool.
+
+Runs concurrent password checks through passwords.verify_password, the same
+path the login route takes, and reports logins per second overall and per
+core. Configure the pool and hash cost with the GRADES_HASH_* and
+GRADES_PASSWORD_METHOD environment variables.
+
+Usage:
+    python -m benchmarks.bench_passwords [--threads 16] [--seconds 5]
+"""
+import argparse
+import os
+import threading
+import time
+
+import passwords
+
+
+def run(threads, seconds):
+    stored = passwords.hash_password('correct horse')
+    # Start the pool before timing
+    passwords.verify_password(stored, 'correct horse')
+
+    done = 0
+    busy = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        nonlocal done, busy
+        while time.perf_counter() < deadline:
+            try:
+                passwords.verify_password(stored, 'correct horse')
+            except passwords.HashingBusy:
+                with lock:
+                    busy += 1
+                continue
+            with lock:
+                done += 1
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    cores = passwords.HASH_WORKERS if passwords.HASH_WORKERS > 0 else 1
+    method = stored.split('$', 1)[0]
+    print(f'method: {method}  workers: {passwords.HASH_WORKERS}  cpus: {os.cpu_count()}  '
+          f'threads: {threads}  queue limit: {passwords.MAX_PENDING}')
+    print(f'logins: {done} in {elapsed:.2f}s  rejected (busy): {busy}')
+    print(f'logins/s: {done / elapsed:.1f}  logins/s/core: {done / elapsed / cores:.1f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark password checks per second')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent request threads')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args(argv)
+    run(args.threads, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Route, grade calculation and SQLite benchmarks against a synthetic database.
+
+Usage:
+    python -m benchmarks.bench_routes --users 20 --assignments 300 --output run.json
+    python -m benchmarks.bench_routes --db existing.db --iterations 500
+
+Each benchmark reports p50/p95/p99 latency in milliseconds and throughput.
+Compare two saved runs with benchmarks.compare.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import database
+from benchmarks.datagen import PASSWORD, generate_database
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    """Latency percentiles (ms) and throughput for a list of durations in seconds"""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        'count': len(ordered),
+        'p50_ms': percentile(ordered, 0.50) * 1000,
+        'p95_ms': percentile(ordered, 0.95) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'mean_ms': total / len(ordered) * 1000 if ordered else 0.0,
+        'ops_per_second': len(ordered) / total if total else 0.0,
+    }
+
+
+def measure(func, iterations, setup=None):
+    """Time `iterations` calls of func; setup runs untimed before each call"""
+    samples = []
+    for i in range(iterations):
+        if setup:
+            setup(i)
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def _expect(response, status=200):
+    if response.status_code != status:
+        raise RuntimeError(f'{response.request.path} returned {response.status_code}, expected {status}')
+    # Streamed pages only render as the body is read
+    response.get_data()
+    return response
+
+
+def run_benchmarks(db_path, iterations=200):
+    """Run every benchmark against db_path and return the results dict"""
+    database.init_db(db_path)
+    from app import create_app
+    from aeries_parser import calculate_grade
+    from grade_engine import get_class_grade, calculate_grades_bulk
+
+    app = create_app({'DATABASE': db_path, 'TESTING': True})
+    client = app.test_client()
+    conn = database.get_db_connection(db_path)
+
+    user = conn.execute('SELECT id, username FROM users ORDER BY id LIMIT 1').fetchone()
+    # The benchmark class is the user's biggest one
+    class_id = conn.execute(
+        '''SELECT c.id FROM classes c JOIN assignments a ON a.class_id = c.id
+           WHERE c.user_id = ? GROUP BY c.id ORDER BY COUNT(*) DESC LIMIT 1''',
+        (user['id'],)
+    ).fetchone()[0]
+    category_id = conn.execute('SELECT id FROM categories WHERE class_id = ? LIMIT 1',
+                               (class_id,)).fetchone()[0]
+    categories = {row['name']: row['weight'] for row in conn.execute(
+        'SELECT name, weight FROM categories WHERE class_id = ?', (class_id,))}
+    assignments = [dict(row) for row in conn.execute(
+        'SELECT c.name AS category, a.points_earned, a.points_possible FROM assignments a JOIN categories c ON a.category_id = c.id WHERE a.class_id = ?',
+        (class_id,))]
+
+    login_form = {'username': user['username'], 'password': PASSWORD}
+    results = {}
+
+    results['calculate_grade'] = measure(lambda i: calculate_grade(assignments, categories), iterations)
+    results['sql_class_grade'] = measure(lambda i: get_class_grade(conn, class_id), iterations)
+    results['sql_grades_bulk'] = measure(lambda i: calculate_grades_bulk(user['id'], conn), iterations)
+
+    # Password hashing makes logins slow on purpose, so run fewer of them
+    results['login'] = measure(
+        lambda i: _expect(client.post('/login', data=login_form), 302), max(5, iterations // 20))
+
+    _expect(client.post('/login', data=login_form), 302)
+    results['dashboard'] = measure(lambda i: _expect(client.get('/dashboard')), iterations)
+    results['view_class'] = measure(lambda i: _expect(client.get(f'/class/{class_id}')), iterations)
+    results['view_class_uncached'] = measure(
+        lambda i: _expect(client.get(f'/class/{class_id}')), iterations,
+        setup=lambda i: app.extensions['grades_caches'].fragments.clear())
+
+    def add(i):
+        _expect(client.post(f'/class/{class_id}/add_assignment', data={
+            'description': f'Bench {i}', 'category_id': category_id,
+            'points_earned': '8', 'points_possible': '10'}), 302)
+
+    results['add_assignment'] = measure(add, iterations)
+    created = [row[0] for row in conn.execute(
+        "SELECT id FROM assignments WHERE class_id = ? AND description LIKE 'Bench %' ORDER BY id",
+        (class_id,))]
+
+    def edit(i):
+        _expect(client.post(f'/assignment/{created[i]}/edit', data={
+            'description': f'Bench {i}', 'category_id': category_id,
+            'points_earned': '9', 'points_possible': '10'}), 302)
+
+    results['edit_assignment'] = measure(edit, len(created))
+    results['delete_assignment'] = measure(
+        lambda i: _expect(client.post(f'/assignment/{created[i]}/delete'), 302), len(created))
+
+    counts = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+              for table in ('users', 'classes', 'categories', 'assignments')}
+    conn.close()
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': iterations,
+            'rows': counts,
+            'class_assignments': len(assignments),
+        },
+        'results': results,
+    }
+
+
+def print_results(run):
+    print(f'{"benchmark":<22} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"ops/s":>10}')
+    for name, stats in run['results'].items():
+        print(f'{name:<22} {stats["p50_ms"]:>9.3f} {stats["p95_ms"]:>9.3f} '
+              f'{stats["p99_ms"]:>9.3f} {stats["ops_per_second"]:>10.1f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark routes, calculate_grade and SQLite')
+    parser.add_argument('--db', help='use an existing database instead of generating one')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--classes', type=int, default=8)
+    parser.add_argument('--assignments', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', help='save results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    db_path = args.db
+    if not db_path:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='grades-bench-'), 'bench.db')
+        counts = generate_database(db_path, args.users, args.classes, args.assignments)
+        print(f"Generated {counts['assignments']} assignments in {counts['seconds']:.1f}s")
+
+    run = run_benchmarks(os.path.abspath(db_path), args.iterations)
+    print_results(run)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f'Saved results to {args.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Worker cold start benchmark.
+
+Each trial runs in a fresh interpreter, like a restarted prefork worker, and
+times importing app.py, create_app() and the first two requests. Trials run
+once with an empty template bytecode cache and once with a precompiled one.
+
+Usage:
+    python -m benchmarks.bench_startup [--trials 10] [--output startup.json]
+
+Results use the same format as bench_routes, so benchmarks.compare works on
+them.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_routes import print_results, summarize
+from benchmarks.datagen import generate_database
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter and prints one JSON line of timings in seconds
+TRIAL = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app({'TESTING': True})
+created = time.perf_counter()
+client = flask_app.test_client()
+client.get('/login')
+first = time.perf_counter()
+client.get('/login')
+second = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_request': first - created,
+    'second_request': second - first,
+    'total_to_first_response': first - start,
+}))
+'''
+
+
+def run_trial(db_path, cache_dir):
+    env = dict(os.environ, GRADES_DB=db_path, GRADES_TEMPLATE_CACHE=cache_dir)
+    output = subprocess.run([sys.executable, '-c', TRIAL], cwd=PROJECT_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_benchmarks(db_path, trials=10):
+    """Time cold and warm template cache starts and return the results dict"""
+    samples = {}
+    cache_dir = tempfile.mkdtemp(prefix='grades-jinja-')
+    try:
+        for scenario in ('cold_cache', 'warm_cache'):
+            for _ in range(trials):
+                if scenario == 'cold_cache':
+                    shutil.rmtree(cache_dir)
+                    os.makedirs(cache_dir)
+                for name, seconds in run_trial(db_path, cache_dir).items():
+                    samples.setdefault(f'{scenario}_{name}', []).append(seconds)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'trials': trials,
+        },
+        'results': {name: summarize(values) for name, values in samples.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark worker cold start')
+    parser.add_argument('--db', help='use an existing database instead of generating one')
+    parser.add_argument('--trials', type=int, default=10)
+    parser.add_argument('--output', help='save results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    db_path = args.db
+    if not db_path:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='grades-bench-'), 'bench.db')
+        generate_database(db_path, users=1, classes_per_user=1, assignments_per_class=10)
+
+    run = run_benchmarks(os.path.abspath(db_path), args.trials)
+    print_results(run)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f'Saved results to {args.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Multi-process load test: throughput of the app behind N prefork workers.
+
+Forks N worker processes that all accept on one listening socket, like a
+prefork WSGI server, logs in once through whichever worker answers, then has
+client processes hit the dashboard with that session for a fixed time.
+Requests that come back as anything but 200 (e.g. a redirect to the login
+page because another worker rejected the session) count as failures.
+
+Usage:
+    python -m benchmarks.bench_workers [--workers 1 2 4] [--seconds 5]
+"""
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import socket
+import sys
+import tempfile
+import time
+import urllib.parse
+
+from benchmarks.bench_routes import print_results, summarize
+from benchmarks.datagen import PASSWORD, generate_database
+
+
+def _serve(sock, db_path):
+    # Imported after the fork, so each worker builds its own app and
+    # database connections
+    from werkzeug.serving import BaseWSGIServer
+    from app import create_app
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = BaseWSGIServer('127.0.0.1', 0, create_app({'DATABASE': db_path}), fd=sock.fileno())
+    server.serve_forever()
+
+
+def _request(port, method, path, headers=None, body=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        response.read()
+        return response
+    finally:
+        conn.close()
+
+
+def _login(port, username):
+    body = urllib.parse.urlencode({'username': username, 'password': PASSWORD})
+    response = _request(port, 'POST', '/login', {'Content-Type': 'application/x-www-form-urlencoded'}, body)
+    cookie = response.getheader('Set-Cookie')
+    if response.status != 302 or not cookie:
+        raise RuntimeError(f'Login failed with status {response.status}')
+    return cookie.split(';', 1)[0]
+
+
+def _client(port, cookie, seconds, results):
+    latencies = []
+    failures = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = _request(port, 'GET', '/dashboard', {'Cookie': cookie})
+        latencies.append(time.perf_counter() - start)
+        if response.status != 200:
+            failures += 1
+    results.put((latencies, failures))
+
+
+def run_load(db_path, workers, clients, seconds):
+    """Serve with `workers` processes and load them with `clients` processes"""
+    context = multiprocessing.get_context('fork')
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(128)
+    port = sock.getsockname()[1]
+
+    servers = [context.Process(target=_serve, args=(sock, db_path), daemon=True) for _ in range(workers)]
+    for server in servers:
+        server.start()
+    try:
+        cookie = _login(port, 'user0')
+        results = context.Queue()
+        started = time.perf_counter()
+        loaders = [context.Process(target=_client, args=(port, cookie, seconds, results))
+                   for _ in range(clients)]
+        for loader in loaders:
+            loader.start()
+        collected = [results.get() for _ in loaders]
+        for loader in loaders:
+            loader.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.join()
+        sock.close()
+
+    latencies = [value for batch, _ in collected for value in batch]
+    stats = summarize(latencies)
+    stats['ops_per_second'] = len(latencies) / elapsed
+    stats['failures'] = sum(failures for _, failures in collected)
+    return stats
+
+
+def main(argv=None):
+    cores = os.cpu_count() or 1
+    default_workers = sorted({1, 2, cores // 2 or 1, cores})
+    parser = argparse.ArgumentParser(description='Load test the app behind N worker processes')
+    parser.add_argument('--db', help='use an existing database instead of generating one')
+    parser.add_argument('--workers', type=int, nargs='+', default=default_workers)
+    parser.add_argument('--clients', type=int, help='client processes (default: 2 per worker)')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--output', help='save results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix='grades-bench-')
+    # Every worker must sign sessions with the same key
+    os.environ.setdefault('GRADES_SECRET_KEY_FILE', os.path.join(tmp, 'secret_key'))
+    os.environ.setdefault('GRADES_TEMPLATE_CACHE', os.path.join(tmp, 'jinja_cache'))
+    os.environ.setdefault('GRADES_HASH_WORKERS', '0')
+
+    db_path = args.db
+    if not db_path:
+        db_path = os.path.join(tmp, 'bench.db')
+        generate_database(db_path, users=2, classes_per_user=8, assignments_per_class=100)
+    db_path = os.path.abspath(db_path)
+
+    results = {}
+    for workers in args.workers:
+        clients = args.clients or workers * 2
+        results[f'workers_{workers}'] = run_load(db_path, workers, clients, args.seconds)
+
+    baseline = results[f'workers_{args.workers[0]}']['ops_per_second']
+    for stats in results.values():
+        stats['scaling'] = stats['ops_per_second'] / baseline if baseline else 0.0
+
+    run = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': cores,
+            'seconds': args.seconds,
+        },
+        'results': results,
+    }
+    print_results(run)
+    for name, stats in results.items():
+        print(f'{name}: {stats["scaling"]:.2f}x, {stats["failures"]} failed requests')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f'Saved results to {args.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Compare two saved benchmark runs and flag regressions.
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 10]
+
+Exits with status 1 if any benchmark's p50 or p95 latency got worse by more
+than the threshold percentage.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+# Only these metrics can fail the comparison; p99 is too noisy on short runs
+GATED_METRICS = ('p50_ms', 'p95_ms')
+
+
+def compare_runs(baseline, candidate, threshold=10.0):
+    """
+    Compare two benchmark result dicts.
+
+    Returns:
+        List of (benchmark, metric, old, new, change_percent, regressed) rows
+    """
+    rows = []
+    for name, old in baseline['results'].items():
+        new = candidate['results'].get(name)
+        if new is None:
+            continue
+        for metric in METRICS:
+            before, after = old[metric], new[metric]
+            change = (after - before) / before * 100 if before else 0.0
+            regressed = metric in GATED_METRICS and change > threshold
+            rows.append((name, metric, before, after, change, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark runs')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent slowdown that counts as a regression')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    rows = compare_runs(baseline, candidate, args.threshold)
+    print(f'{"benchmark":<22} {"metric":<7} {"before":>9} {"after":>9} {"change":>8}')
+    for name, metric, before, after, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f'{name:<22} {metric:<7} {before:>9.3f} {after:>9.3f} {change:>+7.1f}%{flag}')
+
+    regressions = [row for row in rows if row[5]]
+    if regressions:
+        print(f'{len(regressions)} regression(s) over {args.threshold:g}%')
+        return 1
+    print('No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
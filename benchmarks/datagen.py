@@ -0,0 +1,117 @@
+"""
+Generate realistic synthetic grade databases for benchmarking.
+
+Usage:
+    python -m benchmarks.datagen bench.db --users 100 --classes 8 --assignments 200
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+
+from werkzeug.security import generate_password_hash
+
+import database
+
+# Every generated user shares this password
+PASSWORD = 'bench'
+
+CATEGORY_SETS = [
+    [('Classwork', 10.0), ('Labs', 30.0), ('Tests & Quizzes', 60.0)],
+    [('Homework', 20.0), ('Quizzes', 30.0), ('Tests', 50.0)],
+    [('Assignments', 100.0)],
+    [('Participation', 10.0), ('Homework', 15.0), ('Projects', 25.0), ('Exams', 50.0)],
+]
+SUBJECTS = ['Algebra II', 'AP Biology', 'English 11', 'US History', 'Chemistry',
+            'Spanish III', 'AP Physics', 'Art', 'PE', 'Statistics', 'IB Math HL']
+POINTS = [5, 10, 10, 20, 25, 35, 50, 75, 100]
+
+
+def _assignment_rows(rng, class_id, category_ids, count, graded_ratio, start_date):
+    for i in range(count):
+        category_id = rng.choice(category_ids)
+        possible = float(rng.choice(POINTS))
+        earned = None
+        if rng.random() < graded_ratio:
+            # Mostly good scores with a tail of low ones
+            earned = round(possible * min(1.0, max(0.0, rng.gauss(0.86, 0.12))), 1)
+        due = start_date + datetime.timedelta(days=i * 180 // max(count, 1))
+        completed = due.isoformat() if earned is not None else None
+        yield (class_id, category_id, f'Assignment {i + 1}', earned, possible, '', completed, due.isoformat())
+
+
+def generate_database(path, users=10, classes_per_user=8, assignments_per_class=100,
+                      graded_ratio=0.85, seed=0):
+    """
+    Create a new database at `path` filled with synthetic data.
+
+    Users are named user0, user1, ... with password 'bench'. Returns a dict
+    with row counts and the time taken.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    database.init_db(path)
+    conn = database.get_db_connection(path)
+
+    hashed_password = generate_password_hash(PASSWORD)
+    counts = {'users': 0, 'classes': 0, 'categories': 0, 'assignments': 0}
+    try:
+        for u in range(users):
+            user_id = conn.execute('INSERT INTO users (username, password) VALUES (?, ?)',
+                                   (f'user{u}', hashed_password)).lastrowid
+            counts['users'] += 1
+            for c in range(classes_per_user):
+                class_id = conn.execute(
+                    'INSERT INTO classes (user_id, class_name, teacher_name) VALUES (?, ?, ?)',
+                    (user_id, rng.choice(SUBJECTS), f'Teacher {c}')
+                ).lastrowid
+                category_ids = []
+                for name, weight in rng.choice(CATEGORY_SETS):
+                    category_ids.append(conn.execute(
+                        'INSERT INTO categories (class_id, name, weight) VALUES (?, ?, ?)',
+                        (class_id, name, weight)
+                    ).lastrowid)
+                conn.executemany(
+                    'INSERT INTO assignments (class_id, category_id, description, points_earned, points_possible, comment, date_completed, due_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    _assignment_rows(rng, class_id, category_ids, assignments_per_class,
+                                     graded_ratio, datetime.date(2025, 8, 15))
+                )
+                counts['classes'] += 1
+                counts['categories'] += len(category_ids)
+                counts['assignments'] += assignments_per_class
+            # Keep transactions to a bounded size on very large runs
+            conn.commit()
+        conn.execute('ANALYZE')
+        conn.commit()
+    finally:
+        conn.close()
+
+    counts['seconds'] = time.perf_counter() - start
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic grades database')
+    parser.add_argument('path')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--classes', type=int, default=8, help='classes per user')
+    parser.add_argument('--assignments', type=int, default=100, help='assignments per class')
+    parser.add_argument('--graded', type=float, default=0.85, help='fraction of graded assignments')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    counts = generate_database(args.path, args.users, args.classes, args.assignments,
+                               args.graded, args.seed)
+    print(f"Generated {counts['users']} users, {counts['classes']} classes, "
+          f"{counts['assignments']} assignments in {counts['seconds']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Application configuration from the environment.
+
+    GRADES_DB              database file (default: database.DB_FILE)
+    GRADES_SECRET_KEY      session signing key
+    GRADES_SECRET_KEY_FALLBACKS
+                           comma separated older keys still accepted for
+                           existing sessions
+    GRADES_SECRET_KEY_FILE file with one key per line: the first signs new
+                           sessions, the rest are accepted (default:
+                           <instance>/secret_key, created on first start)
+    GRADES_TEMPLATE_CACHE  directory for compiled template bytecode, shared
+                           by every worker (default: <instance>/jinja_cache;
+                           empty turns the cache off)
+
+To rotate keys, add a new first line to the key file (or move the old
+GRADES_SECRET_KEY into GRADES_SECRET_KEY_FALLBACKS) and restart the workers.
+Sessions signed with the old key keep working until it is removed.
+"""
+import os
+import secrets
+
+import database
+
+
+def _split_keys(lines):
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
+
+def read_key_file(path):
+    """Keys from a key file, creating it with a random key if it doesn't exist"""
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Write a complete file under a temporary name, then link it into
+        # place, so workers starting together all end up with the same key
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32) + '\n')
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+
+    with open(path) as f:
+        keys = _split_keys(f)
+    if not keys:
+        raise ValueError(f'Secret key file {path} has no keys')
+    return keys
+
+
+def secret_keys(instance_path, environ=None):
+    """(signing key, [older keys still accepted]) from the environment or key file"""
+    environ = os.environ if environ is None else environ
+    if environ.get('GRADES_SECRET_KEY'):
+        fallbacks = _split_keys(environ.get('GRADES_SECRET_KEY_FALLBACKS', '').split(','))
+        return environ['GRADES_SECRET_KEY'], fallbacks
+    path = environ.get('GRADES_SECRET_KEY_FILE') or os.path.join(instance_path, 'secret_key')
+    keys = read_key_file(path)
+    return keys[0], keys[1:]
+
+
+def from_env(instance_path, environ=None):
+    """Flask config values read from the environment"""
+    environ = os.environ if environ is None else environ
+    secret_key, fallbacks = secret_keys(instance_path, environ)
+    return {
+        'DATABASE': environ.get('GRADES_DB') or database.DB_FILE,
+        'SECRET_KEY': secret_key,
+        'SECRET_KEY_FALLBACKS': fallbacks,
+        'TEMPLATE_CACHE_DIR': environ.get('GRADES_TEMPLATE_CACHE'),
+    }
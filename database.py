@@ -1,24 +1,231 @@
+import atexit
 import sqlite3
 import os
+import threading
+import time
+from flask import current_app, g
 from werkzeug.security import generate_password_hash
 
 # Database file path
 DB_FILE = 'grades.db'
 
-def get_db_connection():
-    """Create a database connection"""
-    conn = sqlite3.connect(DB_FILE)
+# Connection tuning
+BUSY_TIMEOUT_MS = 5000              # wait this long for a write lock instead of failing
+CACHE_SIZE_KIB = 8192               # page cache per connection
+MMAP_SIZE = 64 * 1024 * 1024        # memory-mapped I/O window
+STATEMENT_CACHE_SIZE = 256          # prepared statements kept per connection
+
+# One pooled connection per worker thread, keyed by database file
+_pool = threading.local()
+
+# Instrumentation extension points (see metrics.py): the class used for new
+# connections and callables run on every new connection
+connection_factory = sqlite3.Connection
+connection_hooks = []
+
+def get_db_connection(path=None):
+    """Create a database connection (default: DB_FILE)"""
+    conn = sqlite3.connect(path or DB_FILE, timeout=BUSY_TIMEOUT_MS / 1000,
+                           cached_statements=STATEMENT_CACHE_SIZE,
+                           factory=connection_factory)
     conn.row_factory = sqlite3.Row  # This allows us to access columns by name
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KIB}')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute('PRAGMA foreign_keys = ON')
+    for hook in connection_hooks:
+        hook(conn)
     return conn
 
-def init_db():
-    """Initialize the database with tables"""
+def _pooled_connection(path):
+    """Return this thread's connection to path, opening it on first use"""
+    # A forked worker must not reuse connections inherited from its parent
+    if getattr(_pool, 'pid', None) != os.getpid():
+        _pool.connections = {}
+        _pool.pid = os.getpid()
+    connections = _pool.connections
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = get_db_connection(path)
+    return conn
+
+def get_db():
+    """Get the connection for the current app context.
+
+    The connection belongs to the worker thread and is reused across requests,
+    so its page cache and statement cache stay warm. Do not close it; it is
+    released by close_db when the app context tears down. Each app uses the
+    database in its DATABASE setting.
+    """
+    if 'db' not in g:
+        g.db = _pooled_connection(current_app.config['DATABASE'])
+    return g.db
+
+def close_db(exception=None):
+    """Release the app context's connection back to the thread pool"""
+    conn = g.pop('db', None)
+    if conn is not None and conn.in_transaction:
+        # Never hand an open transaction to the next request
+        conn.rollback()
+
+@atexit.register
+def close_pool():
+    """Close every pooled connection owned by the current thread
+
+    Runs at interpreter exit for the main thread, so a single-threaded
+    process (CLI commands, scripts, the dev server's main thread) closes its
+    connections cleanly and the last one checkpoints the WAL. Connections of
+    other threads are closed when their thread-local pool is collected.
+    """
+    if getattr(_pool, 'pid', None) != os.getpid():
+        return
+    connections = _pool.connections
+    while connections:
+        _, conn = connections.popitem()
+        conn.close()
+
+# Columns of the assignments table, shared by init_db and the migration that
+# rebuilds tables created by older versions
+ASSIGNMENT_COLUMNS = '''
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    class_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    points_earned REAL,
+    points_possible REAL NOT NULL,
+    comment TEXT,
+    date_completed TEXT,
+    due_date TEXT,
+    FOREIGN KEY (class_id) REFERENCES classes (id) ON DELETE CASCADE,
+    FOREIGN KEY (category_id) REFERENCES categories (id) ON DELETE CASCADE
+'''
+
+def _align_assignment_columns(conn):
+    """Bring an assignments table from an older init_db up to ASSIGNMENT_COLUMNS"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(assignments)')}
+    if 'name' in columns:
+        # The original layout stored the title in name and a note in
+        # description; the app uses description and comment for those.
+        # SQLite can't drop a NOT NULL column, so copy into a new table.
+        conn.execute(f'CREATE TABLE assignments_new ({ASSIGNMENT_COLUMNS})')
+        conn.execute('''
+            INSERT INTO assignments_new (id, class_id, category_id, description, points_earned, points_possible, comment, due_date)
+            SELECT id, class_id, category_id, name, points_earned, points_possible, description, due_date
+            FROM assignments
+        ''')
+        conn.execute('DROP TABLE assignments')
+        conn.execute('ALTER TABLE assignments_new RENAME TO assignments')
+        return
+    for column in ('comment', 'date_completed', 'due_date'):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE assignments ADD COLUMN {column} TEXT')
+
+def _add_class_gpa_columns(conn):
+    """Per-class GPA settings (see gpa.py)"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(classes)')}
+    for column, definition in (
+        ('term', 'TEXT'),
+        ('level', "TEXT NOT NULL DEFAULT 'regular'"),
+        ('credits', 'REAL NOT NULL DEFAULT 1.0'),
+        ('grade_scale', 'TEXT'),  # JSON [[letter, minimum], ...]; NULL for the defaults
+    ):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE classes ADD COLUMN {column} {definition}')
+
+def _add_assignment_version(conn):
+    """Row version for optimistic concurrency; every UPDATE must bump it"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(assignments)')}
+    if 'version' not in columns:
+        conn.execute('ALTER TABLE assignments ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+
+# Schema changes, applied in order to databases whose PRAGMA user_version is
+# lower. Each entry is (version, description, callable or list of SQL), and
+# each runs in its own short transaction. Never edit a released entry; add a
+# new one.
+MIGRATIONS = [
+    (1, 'align assignments columns with the app', _align_assignment_columns),
+    (2, 'index classes by user and creation time', [
+        # Dashboard: WHERE user_id = ? ORDER BY created_at DESC
+        'CREATE INDEX IF NOT EXISTS idx_classes_user_created ON classes(user_id, created_at)',
+    ]),
+    (3, 'index assignments by category', [
+        # Category deletes cascade through this, and joins from categories use it
+        'CREATE INDEX IF NOT EXISTS idx_assignments_category_id ON assignments(category_id)',
+    ]),
+    (4, 'index categories by class and name', [
+        # Assignment pages are ordered by category name; this replaces the
+        # class_id index, which is its prefix
+        'CREATE INDEX IF NOT EXISTS idx_categories_class_name ON categories(class_id, name)',
+        'DROP INDEX IF EXISTS idx_categories_class_id',
+    ]),
+    (5, 'add class term, level, credits and grade scale', _add_class_gpa_columns),
+    (6, 'add assignment row versions', _add_assignment_version),
+    (7, 'add per-category totals maintained by triggers', lambda conn: create_category_totals(conn)),
+    (8, 'add per-class data versions maintained by triggers', lambda conn: create_class_versions(conn)),
+    (9, 'index assignments by class and category', [
+        'CREATE INDEX IF NOT EXISTS idx_assignments_class_id ON assignments(class_id)',
+        # Keyset pagination of a class's assignments by category, then id
+        'CREATE INDEX IF NOT EXISTS idx_assignments_class_category ON assignments(class_id, category_id, id)',
+    ]),
+    (10, "only count assignments towards their own class's category totals",
+     lambda conn: _replace_category_totals_triggers(conn)),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate(conn):
+    """Apply pending migrations and return [(version, description, seconds)].
+
+    Each migration takes the write lock only for its own transaction, so a
+    live database can be upgraded in place. ANALYZE runs afterwards so the
+    query planner knows about new indexes.
+    """
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+    pending = [m for m in MIGRATIONS if m[0] > current]
+    if not pending:
+        return []
+    
+    applied = []
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # transactions are managed explicitly below
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        for version, description, migration in pending:
+            start = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Another process may have got here first
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                    conn.execute('ROLLBACK')
+                    continue
+                if callable(migration):
+                    migration(conn)
+                else:
+                    for sql in migration:
+                        conn.execute(sql)
+                conn.execute(f'PRAGMA user_version = {version}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            seconds = time.perf_counter() - start
+            applied.append((version, description, seconds))
+            print(f"Applied migration {version} ({description}) in {seconds * 1000:.1f} ms")
         
-        # Enable foreign key support
-        cursor.execute('PRAGMA foreign_keys = ON')
+        if applied:
+            start = time.perf_counter()
+            conn.execute('ANALYZE')
+            print(f"Analyzed database in {(time.perf_counter() - start) * 1000:.1f} ms")
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+def init_db(path=None):
+    """Initialize the database with tables (default: DB_FILE)"""
+    try:
+        conn = get_db_connection(path)
+        cursor = conn.cursor()
         
         # Users table
         cursor.execute('''
@@ -54,27 +261,12 @@ def init_db():
         ''')
         
         # Assignments table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS assignments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                class_id INTEGER NOT NULL,
-                category_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                description TEXT,
-                points_earned REAL,
-                points_possible REAL NOT NULL,
-                due_date DATE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (class_id) REFERENCES classes (id) ON DELETE CASCADE,
-                FOREIGN KEY (category_id) REFERENCES categories (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # Create indexes for better performance
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_assignments_class_id ON assignments(class_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_categories_class_id ON categories(class_id)')
-        
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS assignments ({ASSIGNMENT_COLUMNS})')
         conn.commit()
+        
+        # Everything else (indexes, derived tables and their triggers) is
+        # created by the migrations, which also fix up older databases
+        migrate(conn)
         print("Database initialized successfully")
     except Exception as e:
         print(f"Error initializing database: {e}")
@@ -85,6 +277,170 @@ def init_db():
         if 'conn' in locals():
             conn.close()
 
+def create_category_totals(cursor):
+    """Create the per-category totals table and the triggers that maintain it.
+
+    Every insert, update and delete on assignments adjusts the totals inside
+    the same transaction, so the grade summary can be read in O(categories).
+    Missing rows are backfilled from the assignments table.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS category_totals (
+            category_id INTEGER PRIMARY KEY,
+            class_id INTEGER NOT NULL,
+            points_earned REAL NOT NULL DEFAULT 0,
+            points_possible REAL NOT NULL DEFAULT 0,
+            graded_count INTEGER NOT NULL DEFAULT 0,
+            assignment_count INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (category_id) REFERENCES categories (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_category_totals_class_id ON category_totals(class_id)')
+    
+    create_category_totals_triggers(cursor)
+    
+    rebuild_category_totals(cursor, missing_only=True)
+
+# Adds NEW to its category's totals. Rows whose class_id isn't the category's
+# class are ignored, so an assignment can never count towards another class.
+_ADD_TO_TOTALS = '''
+    INSERT INTO category_totals (category_id, class_id, points_earned, points_possible, graded_count, assignment_count)
+    SELECT NEW.category_id, NEW.class_id, COALESCE(NEW.points_earned, 0), NEW.points_possible,
+           NEW.points_earned IS NOT NULL, 1
+    WHERE EXISTS (SELECT 1 FROM categories WHERE id = NEW.category_id AND class_id = NEW.class_id)
+    ON CONFLICT (category_id) DO UPDATE SET
+        points_earned = points_earned + excluded.points_earned,
+        points_possible = points_possible + excluded.points_possible,
+        graded_count = graded_count + excluded.graded_count,
+        assignment_count = assignment_count + 1;
+'''
+
+# Removes OLD from its category's totals. This is a plain UPDATE so a cascade
+# from a deleted category doesn't recreate its row; matching on class_id skips
+# rows that were never counted. Sums are reset to exactly 0 when the last
+# assignment goes, so float error can't leave a phantom category behind.
+_REMOVE_FROM_TOTALS = '''
+    UPDATE category_totals SET
+        points_earned = CASE WHEN assignment_count <= 1 THEN 0
+                             ELSE points_earned - COALESCE(OLD.points_earned, 0) END,
+        points_possible = CASE WHEN assignment_count <= 1 THEN 0
+                               ELSE points_possible - OLD.points_possible END,
+        graded_count = graded_count - (OLD.points_earned IS NOT NULL),
+        assignment_count = assignment_count - 1
+    WHERE category_id = OLD.category_id AND class_id = OLD.class_id;
+'''
+
+TOTALS_TRIGGERS = ('trg_assignments_totals_insert', 'trg_assignments_totals_delete',
+                   'trg_assignments_totals_update')
+
+def create_category_totals_triggers(cursor):
+    """Create the triggers that keep category_totals in step with assignments"""
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_assignments_totals_insert
+        AFTER INSERT ON assignments
+        BEGIN {_ADD_TO_TOTALS} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_assignments_totals_delete
+        AFTER DELETE ON assignments
+        BEGIN {_REMOVE_FROM_TOTALS} END
+    ''')
+    # An edit is a delete from the old category plus an insert into the new
+    # one, which also covers moving an assignment between categories
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_assignments_totals_update
+        AFTER UPDATE OF category_id, class_id, points_earned, points_possible ON assignments
+        BEGIN {_REMOVE_FROM_TOTALS} {_ADD_TO_TOTALS} END
+    ''')
+
+def _replace_category_totals_triggers(conn):
+    """Recreate the totals triggers with the class check and recount every class"""
+    for trigger in TOTALS_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    create_category_totals_triggers(conn)
+    rebuild_category_totals(conn)
+
+def create_class_versions(cursor):
+    """Create the per-class data version counter and the triggers that bump it.
+
+    Any change to a class, its categories or its assignments increments the
+    class's version in the same transaction, so it can be used as an ETag
+    without reading the assignments.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS class_versions (
+            class_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    bump = '''
+        INSERT INTO class_versions (class_id, version) VALUES ({row}.class_id, 1)
+        ON CONFLICT (class_id) DO UPDATE SET version = version + 1;
+    '''
+    for table in ('assignments', 'categories'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_insert
+            AFTER INSERT ON {table}
+            BEGIN {bump.format(row='NEW')} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_update
+            AFTER UPDATE ON {table}
+            BEGIN {bump.format(row='OLD')} {bump.format(row='NEW')} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_delete
+            AFTER DELETE ON {table}
+            BEGIN {bump.format(row='OLD')} END
+        ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_classes_version_update
+        AFTER UPDATE ON classes
+        BEGIN
+            INSERT INTO class_versions (class_id, version) VALUES (NEW.id, 1)
+            ON CONFLICT (class_id) DO UPDATE SET version = version + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_classes_version_delete
+        AFTER DELETE ON classes
+        BEGIN
+            DELETE FROM class_versions WHERE class_id = OLD.id;
+        END
+    ''')
+
+def rebuild_category_totals(conn, class_id=None, missing_only=False):
+    """Recompute category totals from the assignments table.
+
+    Args:
+        conn: Connection or cursor to run the statements on
+        class_id: Only rebuild this class (default: every class)
+        missing_only: Only fill in categories that have no totals row yet
+    """
+    where = []
+    params = []
+    if class_id is not None:
+        where.append('a.class_id = ?')
+        params.append(class_id)
+    if missing_only:
+        where.append('a.category_id NOT IN (SELECT category_id FROM category_totals)')
+    elif class_id is not None:
+        conn.execute('DELETE FROM category_totals WHERE class_id = ?', (class_id,))
+    else:
+        conn.execute('DELETE FROM category_totals')
+    
+    conn.execute(f'''
+        INSERT INTO category_totals (category_id, class_id, points_earned, points_possible, graded_count, assignment_count)
+        SELECT a.category_id, a.class_id, COALESCE(SUM(a.points_earned), 0), SUM(a.points_possible),
+               COUNT(a.points_earned), COUNT(*)
+        FROM assignments a
+        JOIN categories c ON c.id = a.category_id AND c.class_id = a.class_id
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        GROUP BY a.category_id
+    ''', params)
+
 def create_demo_user():
     """Create a demo user for testing"""
     try:
@@ -106,5 +462,11 @@ def create_demo_user():
         conn.close()
 
 if __name__ == '__main__':
+    import sys
+    if sys.argv[1:2] == ['export']:
+        # python database.py export --user demo --format csv (see export.py)
+        from export import main
+        sys.exit(main(sys.argv[2:]))
+    # init_db applies any pending migrations
     init_db()
     create_demo_user()
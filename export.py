@@ -0,0 +1,148 @@
+"""
+Streaming export of classes, categories and assignments as CSV or NDJSON.
+
+Rows are read from a cursor one chunk at a time and encoded (and optionally
+gzip-compressed) as they go, so memory use does not grow with the size of the
+export.
+
+Usage:
+    python export.py --user demo --format csv > demo.csv
+    python export.py --all --format ndjson --gzip -o grades.ndjson.gz
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+
+COLUMNS = ['username', 'class_id', 'class_name', 'teacher_name', 'category_id', 'category',
+           'weight', 'assignment_id', 'description', 'points_earned', 'points_possible',
+           'comment', 'date_completed', 'due_date']
+
+# Rows fetched from SQLite and encoded per output chunk
+CHUNK_ROWS = 500
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_export_rows(conn, user_id=None):
+    """
+    Yield one tuple per assignment (or per empty category/class), in COLUMNS order.
+
+    Args:
+        conn: Database connection
+        user_id: Only export this user's classes (default: the whole database)
+    """
+    where = 'WHERE cl.user_id = ?' if user_id is not None else ''
+    cursor = conn.execute(
+        f'''SELECT u.username, cl.id, cl.class_name, cl.teacher_name, c.id, c.name, c.weight,
+                   a.id, a.description, a.points_earned, a.points_possible, a.comment,
+                   a.date_completed, a.due_date
+            FROM classes cl
+            JOIN users u ON u.id = cl.user_id
+            LEFT JOIN categories c ON c.class_id = cl.id
+            LEFT JOIN assignments a ON a.category_id = c.id AND a.class_id = cl.id
+            {where}
+            ORDER BY cl.id, c.id, a.id''',
+        (user_id,) if user_id is not None else ()
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(CHUNK_ROWS)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(row)
+    finally:
+        cursor.close()
+
+
+def iter_csv(rows):
+    """Encode rows as CSV, yielding one bytes chunk per CHUNK_ROWS rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson(rows):
+    """Encode rows as newline-delimited JSON objects, chunked like iter_csv"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(COLUMNS, row))))
+        if len(lines) == CHUNK_ROWS:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def iter_gzip(chunks):
+    """Gzip-compress a stream of bytes chunks on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(conn, fmt='csv', user_id=None, compress=False):
+    """Generator of bytes for a full export in the given format"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format "{fmt}"')
+    rows = iter_export_rows(conn, user_id)
+    chunks = iter_csv(rows) if fmt == 'csv' else iter_ndjson(rows)
+    return iter_gzip(chunks) if compress else chunks
+
+
+def main(argv=None):
+    import database
+
+    parser = argparse.ArgumentParser(description='Export grades as CSV or NDJSON')
+    who = parser.add_mutually_exclusive_group(required=True)
+    who.add_argument('--user', help='username to export')
+    who.add_argument('--all', action='store_true', help='export every user (admin)')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--gzip', action='store_true', help='gzip-compress the output')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    parser.add_argument('--db', default=database.DB_FILE, help='database file')
+    args = parser.parse_args(argv)
+
+    conn = database.get_db_connection(args.db)
+    try:
+        user_id = None
+        if args.user:
+            user = conn.execute('SELECT id FROM users WHERE username = ?', (args.user,)).fetchone()
+            if user is None:
+                print(f'No such user: {args.user}', file=sys.stderr)
+                return 1
+            user_id = user['id']
+
+        out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            for chunk in stream_export(conn, args.format, user_id, args.gzip):
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+GPA across a user's classes.
+
+Every class has a level (regular, honors, ap or ib), a credit value, an
+optional term and optionally its own letter-grade cutoffs. A class's letter
+comes from its final grade and cutoffs; the unweighted GPA averages the
+letters' points by credits, and the weighted GPA adds the level's bonus to
+every passing letter.
+"""
+import functools
+import json
+
+# (letter, minimum percentage), highest first
+DEFAULT_CUTOFFS = (('A', 90.0), ('B', 80.0), ('C', 70.0), ('D', 60.0), ('F', 0.0))
+
+LETTER_POINTS = {
+    'A+': 4.0, 'A': 4.0, 'A-': 3.7,
+    'B+': 3.3, 'B': 3.0, 'B-': 2.7,
+    'C+': 2.3, 'C': 2.0, 'C-': 1.7,
+    'D+': 1.3, 'D': 1.0, 'D-': 0.7,
+    'F': 0.0,
+}
+
+# Added to a passing letter's points in the weighted GPA
+LEVEL_BONUS = {'regular': 0.0, 'honors': 0.5, 'ap': 1.0, 'ib': 1.0}
+LEVELS = tuple(LEVEL_BONUS)
+
+
+def normalize_cutoffs(pairs):
+    """
+    Validate (letter, minimum) pairs and sort them highest first.
+
+    Raises:
+        ValueError: on unknown letters, duplicate letters or bad minimums
+    """
+    cutoffs = []
+    for letter, minimum in pairs:
+        letter = str(letter).strip().upper()
+        if letter not in LETTER_POINTS:
+            raise ValueError(f'Unknown letter grade "{letter}"')
+        try:
+            minimum = float(minimum)
+        except (TypeError, ValueError):
+            raise ValueError(f'Cutoff for {letter} must be a number')
+        if minimum < 0:
+            raise ValueError(f'Cutoff for {letter} must not be negative')
+        cutoffs.append((letter, minimum))
+
+    letters = [letter for letter, _ in cutoffs]
+    if len(set(letters)) != len(letters):
+        raise ValueError('Each letter grade can only have one cutoff')
+    if not cutoffs:
+        raise ValueError('Enter at least one cutoff')
+
+    cutoffs.sort(key=lambda cutoff: cutoff[1], reverse=True)
+    # Anything below the lowest cutoff is an F
+    if cutoffs[-1][1] > 0 and 'F' not in letters:
+        cutoffs.append(('F', 0.0))
+    return tuple(cutoffs)
+
+
+@functools.lru_cache(maxsize=256)
+def parse_cutoffs(stored):
+    """Cutoffs from a class's stored JSON, or the defaults if it has none"""
+    if not stored:
+        return DEFAULT_CUTOFFS
+    return normalize_cutoffs(json.loads(stored))
+
+
+def cutoffs_from_text(text):
+    """Parse cutoffs typed as "A=90, B=80, C=70"; blank means the defaults (None)"""
+    if not text or not text.strip():
+        return None
+    pairs = []
+    for part in text.replace('\n', ',').split(','):
+        if not part.strip():
+            continue
+        letter, sep, minimum = part.partition('=')
+        if not sep:
+            raise ValueError(f'Write each cutoff as LETTER=PERCENT, not "{part.strip()}"')
+        pairs.append((letter, minimum))
+    return normalize_cutoffs(pairs)
+
+
+def cutoffs_to_json(cutoffs):
+    return json.dumps([list(cutoff) for cutoff in cutoffs]) if cutoffs else None
+
+
+def cutoffs_to_text(cutoffs):
+    return ', '.join(f'{letter}={minimum:g}' for letter, minimum in cutoffs)
+
+
+def letter_grade(percentage, cutoffs=DEFAULT_CUTOFFS):
+    for letter, minimum in cutoffs:
+        if percentage >= minimum:
+            return letter
+    return cutoffs[-1][0]
+
+
+def grade_points(percentage, cutoffs=DEFAULT_CUTOFFS):
+    """Unweighted grade points for a percentage"""
+    return LETTER_POINTS[letter_grade(percentage, cutoffs)]
+
+
+def weighted_points(points, level):
+    """Grade points plus the level's bonus; failing letters get no bonus"""
+    return points + LEVEL_BONUS.get(level, 0.0) if points > 0 else points
+
+
+def compute_gpa(results):
+    """
+    GPA from calculate_grades_bulk results.
+
+    Classes without any graded categories are listed but don't count.
+
+    Returns:
+        Dict with overall 'unweighted', 'weighted' and 'credits', a
+        'classes' list with each class's letter and points, and the same
+        totals per term under 'terms'
+    """
+    classes = []
+    totals = {}  # term -> [credits, unweighted points, weighted points]
+    for result in results:
+        class_info = result['class_info']
+        grade_info = result['grade_info']
+        entry = {
+            'id': class_info['id'],
+            'class_name': class_info['class_name'],
+            'term': class_info['term'],
+            'level': class_info['level'],
+            'credits': class_info['credits'],
+            'percentage': None,
+            'letter': None,
+            'points': None,
+            'weighted_points': None,
+        }
+        classes.append(entry)
+        if not grade_info['category_scores']:
+            continue
+
+        cutoffs = parse_cutoffs(class_info['grade_scale'])
+        percentage = grade_info['final_grade']
+        letter = letter_grade(percentage, cutoffs)
+        points = LETTER_POINTS[letter]
+        weighted = weighted_points(points, class_info['level'])
+        entry.update(percentage=percentage, letter=letter, points=points,
+                     weighted_points=weighted)
+
+        credits = class_info['credits'] or 0
+        for term in (None, class_info['term']):
+            term_totals = totals.setdefault(term, [0.0, 0.0, 0.0])
+            term_totals[0] += credits
+            term_totals[1] += points * credits
+            term_totals[2] += weighted * credits
+            if class_info['term'] is None:
+                break
+
+    def summary(term_totals):
+        credits, unweighted, weighted = term_totals
+        return {
+            'unweighted': unweighted / credits if credits else None,
+            'weighted': weighted / credits if credits else None,
+            'credits': credits,
+        }
+
+    overall = summary(totals.pop(None, [0.0, 0.0, 0.0]))
+    overall['classes'] = classes
+    overall['terms'] = {term: summary(term_totals) for term, term_totals in sorted(totals.items())}
+    return overall
+
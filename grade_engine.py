@@ -0,0 +1,225 @@
+from aeries_parser import calculate_grade
+from database import get_db, rebuild_category_totals
+
+# Totals closer than this are considered equal when checking for drift
+DRIFT_TOLERANCE = 1e-6
+
+
+def grade_from_totals(rows):
+    """
+    Build the calculate_grade result from per-category totals.
+
+    Args:
+        rows: Iterable of (name, weight, points_earned, points_possible,
+              assignment_count), one per category in display order.
+              Categories without assignments may have None totals.
+
+    Returns:
+        Dict with the same shape and values as calculate_grade
+    """
+    # calculate_grade keys categories by name, so merge duplicate names the
+    # same way it does: assignments pool together and the last weight wins
+    categories = {}
+    for name, weight, points_earned, points_possible, assignment_count in rows:
+        totals = categories.get(name)
+        if totals is None:
+            totals = categories[name] = [weight, 0.0, 0.0, 0]
+        totals[0] = weight
+        if assignment_count:
+            totals[1] += points_earned or 0
+            totals[2] += points_possible or 0
+            totals[3] += assignment_count
+
+    category_scores = {}
+    total_weighted_score = 0
+    total_weight = 0
+
+    for category, (weight, points_earned, points_possible, assignment_count) in categories.items():
+        if not assignment_count or points_possible <= 0:
+            continue
+
+        category_percentage = (points_earned / points_possible) * 100
+        weighted_contribution = (category_percentage * weight) / 100
+
+        category_scores[category] = {
+            'points_earned': points_earned,
+            'points_possible': points_possible,
+            'percentage': category_percentage,
+            'weight': weight,
+            'weighted_contribution': weighted_contribution
+        }
+
+        total_weighted_score += weighted_contribution
+        total_weight += weight
+
+    return {
+        'final_grade': total_weighted_score if total_weight > 0 else 0,
+        'category_scores': category_scores
+    }
+
+
+def get_category_rows(conn, class_id):
+    """Load a class's materialized totals in the row shape grade_from_totals takes"""
+    return conn.execute(
+        '''SELECT c.name, c.weight, t.points_earned, t.points_possible, t.assignment_count
+           FROM categories c LEFT JOIN category_totals t ON t.category_id = c.id
+           WHERE c.class_id = ?
+           ORDER BY c.id''',
+        (class_id,)
+    ).fetchall()
+
+
+def get_class_grade(conn, class_id):
+    """Calculate a class's grade from the materialized category totals"""
+    return grade_from_totals(get_category_rows(conn, class_id))
+
+
+def calculate_grades_bulk(user_id, conn=None):
+    """
+    Calculate every class's grade for a user with a single grouped query.
+
+    Args:
+        user_id: Owner of the classes
+        conn: Database connection (default: the app context's connection)
+
+    Returns:
+        List of {'class_info': dict, 'grade_info': dict} in dashboard order
+        (newest class first). grade_info matches calculate_grade.
+    """
+    if conn is None:
+        conn = get_db()
+
+    rows = conn.execute(
+        '''SELECT cl.id, cl.class_name, cl.teacher_name, cl.created_at,
+                  cl.term, cl.level, cl.credits, cl.grade_scale,
+                  c.name, c.weight,
+                  SUM(a.points_earned), SUM(a.points_possible), COUNT(a.id)
+           FROM classes cl
+           LEFT JOIN categories c ON c.class_id = cl.id
+           LEFT JOIN assignments a ON a.category_id = c.id AND a.class_id = cl.id
+           WHERE cl.user_id = ?
+           GROUP BY cl.id, c.id
+           ORDER BY cl.created_at DESC, cl.id DESC, c.id''',
+        (user_id,)
+    ).fetchall()
+
+    results = []
+    category_rows = None
+    for row in rows:
+        if not results or results[-1]['class_info']['id'] != row[0]:
+            if category_rows is not None:
+                results[-1]['grade_info'] = grade_from_totals(category_rows)
+            category_rows = []
+            results.append({
+                'class_info': {
+                    'id': row[0],
+                    'class_name': row[1],
+                    'teacher_name': row[2],
+                    'created_at': row[3],
+                    'term': row[4],
+                    'level': row[5],
+                    'credits': row[6],
+                    'grade_scale': row[7],
+                },
+                'grade_info': None,
+            })
+        if row[8] is not None:
+            category_rows.append(tuple(row[8:]))
+    if results:
+        results[-1]['grade_info'] = grade_from_totals(category_rows)
+    return results
+
+
+def _recalculate_class(conn, class_id):
+    """Recompute a class's grade and graded counts straight from its assignments"""
+    categories = conn.execute(
+        'SELECT id, name, weight FROM categories WHERE class_id = ? ORDER BY id',
+        (class_id,)
+    ).fetchall()
+    assignments = conn.execute(
+        '''SELECT a.category_id, c.name AS category, a.points_earned, a.points_possible
+           FROM assignments a JOIN categories c ON a.category_id = c.id AND c.class_id = a.class_id
+           WHERE a.class_id = ?''',
+        (class_id,)
+    ).fetchall()
+
+    counts = {}
+    for assignment in assignments:
+        count = counts.setdefault(assignment['category_id'], [0, 0])
+        count[0] += 1
+        if assignment['points_earned'] is not None:
+            count[1] += 1
+
+    grade_info = calculate_grade([dict(a) for a in assignments],
+                                 {cat['name']: cat['weight'] for cat in categories})
+    return grade_info, counts
+
+
+def _differs(a, b):
+    return abs((a or 0) - (b or 0)) > DRIFT_TOLERANCE
+
+
+def check_category_totals(conn, class_id=None, repair=True):
+    """
+    Compare the materialized totals against calculate_grade and fix any drift.
+
+    Args:
+        conn: Database connection
+        class_id: Only check this class (default: every class)
+        repair: Rebuild the totals of any class that has drifted
+
+    Returns:
+        List of class ids whose totals had drifted
+    """
+    if class_id is None:
+        class_ids = [row[0] for row in conn.execute('SELECT id FROM classes ORDER BY id')]
+    else:
+        class_ids = [class_id]
+
+    drifted = []
+    for cid in class_ids:
+        expected, counts = _recalculate_class(conn, cid)
+        actual = get_class_grade(conn, cid)
+
+        stored = {
+            row['category_id']: (row['assignment_count'], row['graded_count'])
+            for row in conn.execute(
+                'SELECT category_id, assignment_count, graded_count FROM category_totals WHERE class_id = ?',
+                (cid,)
+            )
+        }
+        stored = {cat: c for cat, c in stored.items() if c[0] or cat in counts}
+
+        bad = (
+            _differs(expected['final_grade'], actual['final_grade'])
+            or expected['category_scores'].keys() != actual['category_scores'].keys()
+            or any(
+                _differs(score['points_earned'], actual['category_scores'][name]['points_earned'])
+                or _differs(score['points_possible'], actual['category_scores'][name]['points_possible'])
+                for name, score in expected['category_scores'].items()
+                if name in actual['category_scores']
+            )
+            or stored != {cat: tuple(c) for cat, c in counts.items()}
+        )
+        if bad:
+            drifted.append(cid)
+            if repair:
+                rebuild_category_totals(conn, class_id=cid)
+
+    if drifted and repair:
+        conn.commit()
+    return drifted
+
+
+if __name__ == '__main__':
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        drifted = check_category_totals(conn)
+    finally:
+        conn.close()
+    if drifted:
+        print(f"Repaired category totals for classes: {', '.join(map(str, drifted))}")
+    else:
+        print("Category totals are consistent")
@@ -0,0 +1,287 @@
+"""
+Bulk import of reviewed Aeries assignments.
+
+The preview form is processed as a pipeline: read_import_form yields the raw
+rows, validate_rows checks and converts them, and write_import stores the
+class, its categories and every assignment in a single transaction.
+
+Re-importing into an existing class goes through reimport instead, which
+matches the rows to the stored assignments and writes only the differences.
+"""
+import time
+from collections import deque
+
+
+def read_import_form(form):
+    """
+    Yield the rows posted by import_preview.html.
+
+    Rows marked with drop_<i> are skipped.
+    """
+    try:
+        count = int(form.get('count', 0))
+    except ValueError:
+        count = 0
+
+    for i in range(count):
+        if form.get(f'drop_{i}'):
+            continue
+        yield {
+            'row': i + 1,
+            'description': (form.get(f'description_{i}') or '').strip(),
+            'category': (form.get(f'category_{i}') or '').strip(),
+            'points_earned': (form.get(f'points_earned_{i}') or '').strip(),
+            'points_possible': (form.get(f'points_possible_{i}') or '').strip(),
+            'comment': (form.get(f'comment_{i}') or '').strip(),
+            'date_completed': (form.get(f'date_completed_{i}') or '').strip() or None,
+            'due_date': (form.get(f'due_date_{i}') or '').strip() or None,
+        }
+
+
+def read_category_weights(form):
+    """Read the category weights carried through the preview form as hidden fields"""
+    weights = {}
+    try:
+        count = int(form.get('category_count', 0))
+    except ValueError:
+        count = 0
+    for i in range(count):
+        name = (form.get(f'category_name_{i}') or '').strip()
+        if not name:
+            continue
+        try:
+            weights[name] = float(form.get(f'category_weight_{i}') or 0)
+        except ValueError:
+            weights[name] = 0.0
+    return weights
+
+
+def validate_rows(rows, errors):
+    """
+    Convert and check each row as it passes through.
+
+    Problems are appended to `errors` as (row number, message) and flag the
+    row with needs_review/notes so the preview can be shown again. Callers
+    must not write anything if `errors` is non-empty afterwards.
+    """
+    for row in rows:
+        problems = []
+        if not row['description']:
+            problems.append('Missing description')
+        if not row['category']:
+            problems.append('Missing category')
+
+        try:
+            row['points_possible'] = float(row['points_possible'])
+            if row['points_possible'] <= 0:
+                problems.append('Points possible must be greater than 0')
+        except ValueError:
+            row['points_possible'] = 0.0
+            problems.append('Points possible is not a number')
+
+        try:
+            row['points_earned'] = float(row['points_earned']) if row['points_earned'] else None
+        except ValueError:
+            row['points_earned'] = None
+            problems.append('Points earned is not a number')
+
+        if problems:
+            row['needs_review'] = True
+            row['notes'] = '; '.join(problems)
+            errors.append((row['row'], row['notes']))
+        else:
+            row['needs_review'] = False
+            row['notes'] = ''
+        yield row
+
+
+def write_import(conn, user_id, class_name, teacher_name, weights, rows):
+    """
+    Create a class from imported rows in one transaction.
+
+    Categories are created by name the first time a row uses them, taking
+    their weight from `weights` (0 if unknown). Assignments are written with
+    a single executemany. Nothing is stored if any statement fails.
+
+    Returns:
+        Dict with class_id, the number of assignments and rows_per_second
+    """
+    start = time.perf_counter()
+    try:
+        cursor = conn.execute(
+            'INSERT INTO classes (user_id, class_name, teacher_name) VALUES (?, ?, ?)',
+            (user_id, class_name, teacher_name)
+        )
+        class_id = cursor.lastrowid
+
+        category_ids = {}
+        values = []
+        for row in rows:
+            category_id = category_ids.get(row['category'])
+            if category_id is None:
+                category_id = category_ids[row['category']] = conn.execute(
+                    'INSERT INTO categories (class_id, name, weight) VALUES (?, ?, ?)',
+                    (class_id, row['category'], weights.get(row['category'], 0.0))
+                ).lastrowid
+            values.append((
+                class_id, category_id, row['description'], row['points_earned'],
+                row['points_possible'], row['comment'], row['date_completed'], row['due_date']
+            ))
+
+        if not category_ids:
+            # Same default as a manually created class
+            conn.execute(
+                'INSERT INTO categories (class_id, name, weight) VALUES (?, ?, ?)',
+                (class_id, 'Assignments', 100.0)
+            )
+
+        conn.executemany(
+            'INSERT INTO assignments (class_id, category_id, description, points_earned, points_possible, comment, date_completed, due_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            values
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    elapsed = time.perf_counter() - start
+    return {
+        'class_id': class_id,
+        'count': len(values),
+        'seconds': elapsed,
+        'rows_per_second': len(values) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def fingerprint(description, category, points_possible):
+    """
+    Identity of an assignment across re-imports.
+
+    Made of what stays the same when a score is entered or corrected, so a
+    re-pasted gradebook row maps back to the row it created last time.
+    """
+    return (' '.join(description.split()).casefold(), category.strip().casefold(),
+            round(float(points_possible), 4))
+
+
+def _changed(row, assignment):
+    return (row['description'] != assignment['description']
+            or row['points_earned'] != assignment['points_earned']
+            or (row['comment'] or '') != (assignment['comment'] or '')
+            or (row['date_completed'] or None) != (assignment['date_completed'] or None)
+            or (row['due_date'] or None) != (assignment['due_date'] or None))
+
+
+def diff_import(existing, rows):
+    """
+    Match validated rows against a class's existing assignments.
+
+    Existing assignments are indexed by fingerprint; rows sharing a
+    fingerprint (e.g. two "Quiz" rows worth 10) are matched in id order.
+
+    Args:
+        existing: Iterable of assignment rows with id, description, category
+            (name), points_earned, points_possible, comment and the dates
+        rows: Validated rows from validate_rows
+
+    Returns:
+        (inserts, updates, deletes, unchanged): rows to insert, (row,
+        assignment) pairs whose scores or details changed, assignments that
+        are no longer in the paste, and the number of untouched matches
+    """
+    index = {}
+    for assignment in existing:
+        key = fingerprint(assignment['description'], assignment['category'], assignment['points_possible'])
+        index.setdefault(key, deque()).append(assignment)
+
+    inserts, updates = [], []
+    unchanged = 0
+    for row in rows:
+        matches = index.get(fingerprint(row['description'], row['category'], row['points_possible']))
+        if not matches:
+            inserts.append(row)
+            continue
+        assignment = matches.popleft()
+        if _changed(row, assignment):
+            updates.append((row, assignment))
+        else:
+            unchanged += 1
+
+    deletes = [assignment for matches in index.values() for assignment in matches]
+    return inserts, updates, deletes, unchanged
+
+
+def reimport(conn, class_id, weights, rows, delete_missing=True):
+    """
+    Bring an existing class in line with a fresh paste, in one transaction.
+
+    Only new, changed and (with delete_missing) vanished assignments are
+    written, so the cost follows the size of the change rather than the
+    class. Categories new to the class are created with their weight from
+    `weights`; existing category weights are left alone.
+
+    Returns:
+        Dict with inserted, updated, deleted and unchanged counts and seconds
+    """
+    start = time.perf_counter()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        category_ids = {}
+        for category_id, name in conn.execute(
+                'SELECT id, name FROM categories WHERE class_id = ? ORDER BY id', (class_id,)):
+            category_ids.setdefault(name.strip().casefold(), category_id)
+
+        existing = conn.execute(
+            '''SELECT a.id, a.description, c.name AS category, a.points_earned, a.points_possible,
+                      a.comment, a.date_completed, a.due_date
+               FROM assignments a JOIN categories c ON c.id = a.category_id
+               WHERE a.class_id = ?
+               ORDER BY a.id''',
+            (class_id,)
+        )
+        inserts, updates, deletes, unchanged = diff_import(existing, rows)
+        if not delete_missing:
+            deletes = []
+
+        if deletes:
+            conn.executemany('DELETE FROM assignments WHERE id = ?',
+                             [(assignment['id'],) for assignment in deletes])
+
+        if updates:
+            conn.executemany(
+                'UPDATE assignments SET description = ?, points_earned = ?, comment = ?, date_completed = ?, due_date = ?, version = version + 1 WHERE id = ?',
+                [(row['description'], row['points_earned'], row['comment'], row['date_completed'],
+                  row['due_date'], assignment['id']) for row, assignment in updates]
+            )
+
+        if inserts:
+            values = []
+            for row in inserts:
+                key = row['category'].strip().casefold()
+                category_id = category_ids.get(key)
+                if category_id is None:
+                    category_id = category_ids[key] = conn.execute(
+                        'INSERT INTO categories (class_id, name, weight) VALUES (?, ?, ?)',
+                        (class_id, row['category'], weights.get(row['category'], 0.0))
+                    ).lastrowid
+                values.append((
+                    class_id, category_id, row['description'], row['points_earned'],
+                    row['points_possible'], row['comment'], row['date_completed'], row['due_date']
+                ))
+            conn.executemany(
+                'INSERT INTO assignments (class_id, category_id, description, points_earned, points_possible, comment, date_completed, due_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                values
+            )
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {
+        'inserted': len(inserts),
+        'updated': len(updates),
+        'deleted': len(deletes),
+        'unchanged': unchanged,
+        'seconds': time.perf_counter() - start,
+    }
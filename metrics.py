@@ -0,0 +1,301 @@
+"""
+Per-request and per-statement instrumentation, served at /metrics in the
+Prometheus text format.
+
+Call metrics.init_app(app) before the first request. Set GRADES_METRICS=0 to
+turn instrumentation off; nothing is hooked into Flask or sqlite3 then, so it
+costs nothing. Set GRADES_SLOW_REQUEST_MS to log requests slower than that.
+"""
+import bisect
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import Response, current_app, request
+
+import database
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+MAX_STATEMENTS = 500     # distinct normalized statements tracked
+TOP_STATEMENTS = 20      # slowest statements exported
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r'\s+')
+
+# State of the request running on this thread
+_local = threading.local()
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Collapse whitespace and replace literals with ? so similar statements group"""
+    return _WHITESPACE.sub(' ', _LITERALS.sub('?', sql)).strip()
+
+
+class Histogram:
+    """Prometheus-style histogram with fixed upper bounds"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """All collected metrics for this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}        # (endpoint, method) -> Histogram of seconds
+        self.queries = {}        # (endpoint, method) -> Histogram of queries per request
+        self.sql_seconds = {}    # (endpoint, method) -> total SQL seconds
+        self.requests = {}       # (endpoint, method, status) -> count
+        self.statements = {}     # normalized SQL -> [calls, total seconds, max seconds]
+        self.traced = 0          # statements seen by the trace hook, trigger bodies included
+
+    def observe_request(self, endpoint, method, status, seconds, queries, sql_seconds):
+        key = (endpoint, method)
+        with self.lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.queries[key] = Histogram(QUERY_BUCKETS)
+                self.sql_seconds[key] = 0.0
+            self.latency[key].observe(seconds)
+            self.queries[key].observe(queries)
+            self.sql_seconds[key] += sql_seconds
+            status_key = (endpoint, method, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+
+    def observe_statement(self, sql, seconds):
+        with self.lock:
+            stats = self.statements.get(sql)
+            if stats is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    return
+                stats = self.statements[sql] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            lines += _histogram('grades_request_duration_seconds', 'Request latency by endpoint',
+                                self.latency)
+            lines += _histogram('grades_request_queries', 'SQL statements executed per request',
+                                self.queries)
+
+            lines.append('# HELP grades_request_sql_seconds_total Time spent in SQL by endpoint')
+            lines.append('# TYPE grades_request_sql_seconds_total counter')
+            for (endpoint, method), seconds in sorted(self.sql_seconds.items()):
+                lines.append(f'grades_request_sql_seconds_total{_labels(endpoint=endpoint, method=method)} {seconds:.6f}')
+
+            lines.append('# HELP grades_requests_total Requests by endpoint and status')
+            lines.append('# TYPE grades_requests_total counter')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'grades_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+            lines.append('# HELP grades_sql_traced_statements_total Statements seen by the sqlite3 trace hook')
+            lines.append('# TYPE grades_sql_traced_statements_total counter')
+            lines.append(f'grades_sql_traced_statements_total {self.traced}')
+
+            slowest = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:TOP_STATEMENTS]
+            for name, kind, index, help_text in (
+                ('grades_sql_statement_seconds_total', 'counter', 1, 'Total time of the slowest normalized statements'),
+                ('grades_sql_statement_calls_total', 'counter', 0, 'Calls of the slowest normalized statements'),
+                ('grades_sql_statement_max_seconds', 'gauge', 2, 'Slowest single call of each statement'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for sql, stats in slowest:
+                    value = stats[index]
+                    value = f'{value:.6f}' if isinstance(value, float) else str(value)
+                    lines.append(f'{name}{_labels(statement=sql)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _histogram(name, help_text, histograms):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for (endpoint, method), histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(endpoint=endpoint, method=method, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{_labels(endpoint=endpoint, method=method)} {histogram.sum:.6f}')
+        lines.append(f'{name}_count{_labels(endpoint=endpoint, method=method)} {histogram.count}')
+    return lines
+
+
+registry = Registry()
+
+# Requests at least this slow are logged; None disables the log
+slow_request_ms = None
+
+
+def _record_statement(sql, seconds, state=None):
+    registry.observe_statement(normalize_sql(sql), seconds)
+    if state is not None:
+        state['queries'] += 1
+        state['sql_seconds'] += seconds
+
+
+class TimedCursor(sqlite3.Cursor):
+    """sqlite3 cursor that times its statement, including fetching the rows
+
+    execute() only runs a SELECT up to its first row; the rest of the work
+    happens as rows are fetched. The time spent in execute and every fetch is
+    added up and recorded once the statement is finished: when its rows run
+    out, or when the cursor is reused, closed or collected.
+    """
+
+    _sql = None
+    _seconds = 0.0
+    _state = None
+
+    def _start(self, sql):
+        self._finish()
+        # The request the statement belongs to, even if it finishes later
+        self._sql, self._seconds, self._state = sql, 0.0, getattr(_local, 'state', None)
+
+    def _finish(self):
+        if self._sql is not None:
+            _record_statement(self._sql, self._seconds, self._state)
+            self._sql = self._state = None
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            self._seconds += time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        self._start(sql)
+        return self._timed(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql)
+        return self._timed(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        row = self._timed(sqlite3.Cursor.fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(sqlite3.Cursor.fetchmany, self.arraysize if size is None else size)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(sqlite3.Cursor.fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors time every statement run through them"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _trace(statement):
+    # Called by sqlite3 for every statement, including trigger bodies
+    with registry.lock:
+        registry.traced += 1
+
+
+def _install_trace(conn):
+    conn.set_trace_callback(_trace)
+
+
+def _before_request():
+    _local.state = {'start': time.perf_counter(), 'queries': 0, 'sql_seconds': 0.0}
+
+
+def _after_request(response):
+    state = getattr(_local, 'state', None)
+    if state is None:
+        return response
+    # Streamed bodies (templates, exports) run their queries after this
+    # returns, so record the request once the server has closed the response
+    endpoint = request.endpoint or 'unmatched'
+    response.call_on_close(functools.partial(
+        _finish_request, state, current_app.logger, endpoint, request.method, request.path,
+        response.status_code))
+    return response
+
+
+def _finish_request(state, logger, endpoint, method, path, status):
+    if getattr(_local, 'state', None) is state:
+        _local.state = None
+    seconds = time.perf_counter() - state['start']
+    registry.observe_request(endpoint, method, status, seconds, state['queries'], state['sql_seconds'])
+
+    if slow_request_ms is not None and seconds * 1000 >= slow_request_ms:
+        logger.warning(
+            'Slow request: %s %s took %.1f ms with %d queries (%.1f ms in SQL)',
+            method, path, seconds * 1000, state['queries'], state['sql_seconds'] * 1000)
+
+
+def metrics_view():
+    """Prometheus scrape endpoint"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Hook instrumentation into a Flask app and all new database connections"""
+    global slow_request_ms
+    if os.environ.get('GRADES_METRICS', '1') == '0':
+        return
+    if os.environ.get('GRADES_SLOW_REQUEST_MS'):
+        slow_request_ms = float(os.environ['GRADES_SLOW_REQUEST_MS'])
+    database.connection_factory = TimedConnection
+    if _install_trace not in database.connection_hooks:
+        database.connection_hooks.append(_install_trace)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,119 @@
+"""
+Password hashing off the request threads.
+
+Hashes are computed in a process pool so a burst of logins can use every core
+instead of blocking Flask worker threads. At most MAX_PENDING hashes may be
+queued or running; beyond that callers wait up to QUEUE_TIMEOUT seconds and
+then get HashingBusy, which the routes turn into a 503.
+
+The pool's workers are started with forkserver (or spawn), not fork, since
+the first hash happens on a request thread. Like any spawned process they
+import the main module, so scripts that hash passwords need an
+`if __name__ == '__main__':` guard.
+
+Configuration (environment):
+    GRADES_PASSWORD_METHOD  werkzeug hash method, e.g. 'scrypt:32768:8:1' or
+                            'pbkdf2:sha256:600000' (default: werkzeug's default)
+    GRADES_HASH_WORKERS     pool processes (default: CPU count; 0 hashes inline)
+    GRADES_HASH_MAX_PENDING queue limit (default: 4 per worker)
+    GRADES_HASH_TIMEOUT     seconds to wait for a queue slot (default: 2)
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+HASH_METHOD = os.environ.get('GRADES_PASSWORD_METHOD') or None
+HASH_WORKERS = int(os.environ.get('GRADES_HASH_WORKERS', os.cpu_count() or 1))
+MAX_PENDING = int(os.environ.get('GRADES_HASH_MAX_PENDING', max(HASH_WORKERS, 1) * 4))
+QUEUE_TIMEOUT = float(os.environ.get('GRADES_HASH_TIMEOUT', 2))
+
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_current_prefix = None
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+
+def _generate(password):
+    if HASH_METHOD:
+        return generate_password_hash(password, method=HASH_METHOD)
+    return generate_password_hash(password)
+
+
+def _start_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def _get_pool():
+    """The process pool for this process, created on first use (and after a fork)"""
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # The pool is started from a request thread, and forking a
+            # multi-threaded process can deadlock the child, so start the
+            # workers from a clean process instead
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=_start_context())
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _discard_pool(pool):
+    """Forget a broken pool so the next _get_pool starts a new one"""
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(func, *args):
+    if HASH_WORKERS <= 0:
+        return func(*args)
+    if not _slots.acquire(timeout=QUEUE_TIMEOUT):
+        raise HashingBusy('Too many password hashes queued')
+    try:
+        pool = _get_pool()
+        try:
+            return pool.submit(func, *args).result()
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory...) and took the pool with
+            # it; start a new one and try once more
+            _discard_pool(pool)
+            return _get_pool().submit(func, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password):
+    """Hash a password with the configured method"""
+    return _run(_generate, password)
+
+
+def verify_password(stored_hash, password):
+    """Check a password against a stored hash"""
+    return _run(check_password_hash, stored_hash, password)
+
+
+def needs_rehash(stored_hash):
+    """True if a stored hash was made with different parameters than configured"""
+    global _current_prefix
+    if _current_prefix is None:
+        # werkzeug fills in default parameters, so take them from a real hash
+        _current_prefix = _generate('').split('$', 1)[0]
+    return stored_hash.split('$', 1)[0] != _current_prefix
+
+
+@atexit.register
+def _shutdown():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=False, cancel_futures=True)
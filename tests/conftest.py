@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Path of a fresh database at the current schema version"""
+    path = str(tmp_path / 'grades.db')
+    database.init_db(path)
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = database.get_db_connection(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def class_id(conn):
+    """A class with two categories, Labs (40%) and Tests (60%)"""
+    user_id = conn.execute(
+        "INSERT INTO users (username, password) VALUES ('student', 'x')").lastrowid
+    class_id = conn.execute(
+        "INSERT INTO classes (user_id, class_name) VALUES (?, 'Biology')", (user_id,)).lastrowid
+    conn.executemany('INSERT INTO categories (class_id, name, weight) VALUES (?, ?, ?)',
+                     [(class_id, 'Labs', 40.0), (class_id, 'Tests', 60.0)])
+    conn.commit()
+    return class_id
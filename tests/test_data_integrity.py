@@ -0,0 +1,226 @@
+"""
+Checks that the data kept on write (category totals, migrations, batches,
+re-imports) agrees with what the app would compute from scratch.
+"""
+import pytest
+
+import database
+from aeries_parser import calculate_grade
+from batch import BatchConflict, BatchError, apply_batch, validate_operations
+from grade_engine import check_category_totals, get_class_grade
+from importer import reimport, write_import
+
+
+def category_ids(conn, class_id):
+    return {row['name']: row['id'] for row in conn.execute(
+        'SELECT id, name FROM categories WHERE class_id = ?', (class_id,))}
+
+
+def add(conn, class_id, category_id, description, earned, possible):
+    assignment_id = conn.execute(
+        'INSERT INTO assignments (class_id, category_id, description, points_earned, points_possible) VALUES (?, ?, ?, ?, ?)',
+        (class_id, category_id, description, earned, possible)
+    ).lastrowid
+    conn.commit()
+    return assignment_id
+
+
+def assert_totals_match(conn, class_id):
+    """The trigger-maintained grade equals calculate_grade over the raw rows"""
+    assignments = [dict(row) for row in conn.execute(
+        '''SELECT c.name AS category, a.points_earned, a.points_possible
+           FROM assignments a JOIN categories c ON c.id = a.category_id
+           WHERE a.class_id = ?''', (class_id,))]
+    categories = {row['name']: row['weight'] for row in conn.execute(
+        'SELECT name, weight FROM categories WHERE class_id = ?', (class_id,))}
+    expected = calculate_grade(assignments, categories)
+    actual = get_class_grade(conn, class_id)
+
+    assert actual['final_grade'] == pytest.approx(expected['final_grade'])
+    assert actual['category_scores'].keys() == expected['category_scores'].keys()
+    for name, score in expected['category_scores'].items():
+        assert actual['category_scores'][name]['points_earned'] == pytest.approx(score['points_earned'])
+        assert actual['category_scores'][name]['points_possible'] == pytest.approx(score['points_possible'])
+    assert check_category_totals(conn, class_id, repair=False) == []
+
+
+def test_totals_follow_insert_move_and_delete(conn, class_id):
+    ids = category_ids(conn, class_id)
+    lab = add(conn, class_id, ids['Labs'], 'Lab 1', 8, 10)
+    add(conn, class_id, ids['Labs'], 'Lab 2', None, 10)
+    test = add(conn, class_id, ids['Tests'], 'Test 1', 45, 50)
+    assert_totals_match(conn, class_id)
+
+    # Moving an assignment takes its points out of the old category
+    conn.execute('UPDATE assignments SET category_id = ?, points_earned = 9 WHERE id = ?',
+                 (ids['Tests'], lab))
+    conn.commit()
+    assert_totals_match(conn, class_id)
+
+    conn.execute('DELETE FROM assignments WHERE id = ?', (test,))
+    conn.commit()
+    assert_totals_match(conn, class_id)
+
+
+def test_assignment_in_another_classes_category_is_not_counted(conn, class_id):
+    ids = category_ids(conn, class_id)
+    other = conn.execute(
+        "INSERT INTO classes (user_id, class_name) SELECT user_id, 'Chemistry' FROM classes WHERE id = ?",
+        (class_id,)).lastrowid
+    conn.commit()
+    add(conn, other, ids['Labs'], 'Stray', 1, 100)
+    add(conn, class_id, ids['Labs'], 'Lab 1', 8, 10)
+    assert_totals_match(conn, class_id)
+
+
+def test_migrate_baseline_database(tmp_path):
+    # The layout created by the first release, where the title was in name
+    # and a note in description
+    path = str(tmp_path / 'old.db')
+    conn = database.get_db_connection(path)
+    conn.executescript('''
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE classes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            class_name TEXT NOT NULL,
+            teacher_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            class_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            weight REAL NOT NULL
+        );
+        CREATE TABLE assignments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            class_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            points_earned REAL,
+            points_possible REAL NOT NULL,
+            due_date DATE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT INTO users (username, password) VALUES ('student', 'x');
+        INSERT INTO classes (user_id, class_name) VALUES (1, 'Biology');
+        INSERT INTO categories (class_id, name, weight) VALUES (1, 'Labs', 40), (1, 'Tests', 60);
+        INSERT INTO assignments (class_id, category_id, name, description, points_earned, points_possible)
+        VALUES (1, 1, 'Lab 1', 'late', 8, 10), (1, 2, 'Test 1', NULL, 45, 50);
+    ''')
+    conn.commit()
+
+    applied = database.migrate(conn)
+
+    assert [version for version, _, _ in applied] == [m[0] for m in database.MIGRATIONS]
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == database.SCHEMA_VERSION
+    row = conn.execute('SELECT description, comment, version FROM assignments WHERE id = 1').fetchone()
+    assert tuple(row) == ('Lab 1', 'late', 1)
+    assert_totals_match(conn, 1)
+    assert database.migrate(conn) == []
+    conn.close()
+
+
+def test_batch_conflict_writes_nothing(conn, class_id):
+    ids = category_ids(conn, class_id)
+    lab = add(conn, class_id, ids['Labs'], 'Lab 1', 8, 10)
+    conn.execute('UPDATE assignments SET points_earned = 9, version = version + 1 WHERE id = ?', (lab,))
+    conn.commit()
+
+    creates, updates, deletes = validate_operations([
+        {'op': 'create', 'description': 'Lab 2', 'category_id': ids['Labs'], 'points_possible': 10},
+        {'op': 'update', 'id': lab, 'version': 1, 'points_earned': 10},
+    ], set(ids.values()))
+    with pytest.raises(BatchConflict) as info:
+        apply_batch(conn, class_id, creates, updates, deletes)
+
+    assert info.value.conflicts == [{'id': lab, 'expected': 1, 'actual': 2}]
+    assert conn.execute('SELECT COUNT(*) FROM assignments').fetchone()[0] == 1
+    assert conn.execute('SELECT points_earned FROM assignments WHERE id = ?', (lab,)).fetchone()[0] == 9
+    assert_totals_match(conn, class_id)
+
+
+def test_batch_with_unknown_id_rolls_back(conn, class_id):
+    ids = category_ids(conn, class_id)
+    lab = add(conn, class_id, ids['Labs'], 'Lab 1', 8, 10)
+
+    creates, updates, deletes = validate_operations([
+        {'op': 'create', 'description': 'Lab 2', 'category_id': ids['Labs'], 'points_possible': 10},
+        {'op': 'delete', 'id': lab, 'version': 1},
+        {'op': 'delete', 'id': lab + 100, 'version': 1},
+    ], set(ids.values()))
+    with pytest.raises(BatchError):
+        apply_batch(conn, class_id, creates, updates, deletes)
+
+    assert [row[0] for row in conn.execute('SELECT id FROM assignments')] == [lab]
+    assert not conn.in_transaction
+
+
+def test_batch_applies_and_keeps_totals(conn, class_id):
+    ids = category_ids(conn, class_id)
+    lab = add(conn, class_id, ids['Labs'], 'Lab 1', 8, 10)
+    test = add(conn, class_id, ids['Tests'], 'Test 1', 45, 50)
+
+    creates, updates, deletes = validate_operations([
+        {'op': 'create', 'description': 'Lab 2', 'category_id': ids['Labs'], 'points_possible': 10,
+         'points_earned': 7},
+        {'op': 'update', 'id': lab, 'version': 1, 'category_id': ids['Tests']},
+        {'op': 'delete', 'id': test, 'version': 1},
+    ], set(ids.values()))
+    result = apply_batch(conn, class_id, creates, updates, deletes)
+
+    assert result['updated'] == [{'id': lab, 'version': 2}]
+    assert result['deleted'] == [test]
+    assert len(result['created']) == 1
+    assert_totals_match(conn, class_id)
+
+
+def row(description, category, earned, possible, comment=''):
+    return {'description': description, 'category': category, 'points_earned': earned,
+            'points_possible': possible, 'comment': comment,
+            'date_completed': None, 'due_date': None}
+
+
+def test_reimport_counts_only_changes(conn, class_id):
+    user_id = conn.execute('SELECT user_id FROM classes WHERE id = ?', (class_id,)).fetchone()[0]
+    weights = {'Labs': 40.0, 'Tests': 60.0}
+    rows = [
+        row('Lab 1', 'Labs', 8.0, 10.0),
+        row('Quiz', 'Tests', 4.0, 5.0),
+        row('Quiz', 'Tests', None, 5.0),
+        row('Test 1', 'Tests', 45.0, 50.0),
+    ]
+    imported = write_import(conn, user_id, 'Chemistry', '', weights, rows)['class_id']
+
+    unchanged = reimport(conn, imported, weights, rows)
+    assert (unchanged['inserted'], unchanged['updated'], unchanged['deleted'], unchanged['unchanged']) == (0, 0, 0, 4)
+
+    rows = [
+        row('Lab 1', 'Labs', 8.0, 10.0),
+        row('Quiz', 'Tests', 4.0, 5.0),
+        row('Quiz', 'Tests', 5.0, 5.0),     # the second quiz got graded
+        row('Lab 2', 'Labs', 9.0, 10.0),    # new
+        row('Final', 'Finals', 90.0, 100.0),  # new, in a new category
+    ]                                       # Test 1 was dropped
+    result = reimport(conn, imported, dict(weights, Finals=20.0), rows)
+    assert (result['inserted'], result['updated'], result['deleted'], result['unchanged']) == (2, 1, 1, 2)
+
+    stored = conn.execute(
+        '''SELECT a.description, c.name, a.points_earned FROM assignments a
+           JOIN categories c ON c.id = a.category_id WHERE a.class_id = ? ORDER BY a.id''',
+        (imported,)).fetchall()
+    assert [tuple(r) for r in stored] == [
+        ('Lab 1', 'Labs', 8.0), ('Quiz', 'Tests', 4.0), ('Quiz', 'Tests', 5.0),
+        ('Lab 2', 'Labs', 9.0), ('Final', 'Finals', 90.0),
+    ]
+    assert_totals_match(conn, imported)
+
+    kept = reimport(conn, imported, weights, rows[:1], delete_missing=False)
+    assert (kept['deleted'], kept['unchanged']) == (0, 1)
@@ -0,0 +1,248 @@
+"""
+Grade-over-time series built from dated assignments.
+
+An assignment counts from its completion date, or its due date if it has not
+been completed. Sorting the dated assignments once and keeping running
+per-category point sums gives the grade after every assignment in
+O(n log n) overall, with the same semantics as calculate_grade at each step.
+Assignments without a usable date are left out of the series.
+"""
+import datetime
+import functools
+import heapq
+
+from gpa import grade_points, parse_cutoffs, weighted_points
+
+BUCKETS = ('assignment', 'day', 'week')
+
+_DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y', '%Y/%m/%d')
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(value):
+    """Parse an ISO or Aeries (MM/DD/YYYY) date, ignoring any time part; None if unusable"""
+    text = str(value).strip() if value else ''
+    if not text:
+        return None
+    text = text.split()[0].split('T')[0]
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def grade_timeline(categories, assignments, by='assignment'):
+    """
+    Compute a class's grade after each dated assignment, day or week.
+
+    Args:
+        categories: Iterable of (name, weight) in category id order; like
+            calculate_grade, a repeated name keeps its last weight
+        assignments: Iterable of (id, description, category name,
+            points_earned, points_possible, date_completed, due_date)
+        by: 'assignment' for a point per assignment, or 'day'/'week' for
+            the grade at the end of each day/week (weeks start on Monday)
+
+    Returns:
+        Dict with 'points' (list of {'date', 'grade', ...} in date order)
+        and 'undated' (number of assignments left out)
+    """
+    if by not in BUCKETS:
+        raise ValueError(f'Unknown timeline bucket "{by}"')
+
+    weights = {}
+    for name, weight in categories:
+        weights[name] = weight
+
+    dated = []
+    undated = 0
+    for assignment_id, description, category, earned, possible, completed, due in assignments:
+        when = parse_date(completed) or parse_date(due)
+        if when is None:
+            undated += 1
+        elif category in weights:
+            dated.append((when, assignment_id, description, category, earned, possible))
+    dated.sort(key=lambda row: (row[0], row[1]))
+
+    # Running per-category sums and the weighted total they add up to
+    earned_sums = dict.fromkeys(weights, 0.0)
+    possible_sums = dict.fromkeys(weights, 0.0)
+    contributions = {}
+    total = 0.0
+
+    points = []
+    for when, assignment_id, description, category, earned, possible in dated:
+        earned_sums[category] += earned or 0
+        possible_sums[category] += possible or 0
+
+        old = contributions.pop(category, None)
+        if old is not None:
+            total -= old
+        if possible_sums[category] > 0:
+            new = earned_sums[category] / possible_sums[category] * weights[category]
+            contributions[category] = new
+            total += new
+        grade = total if contributions else 0.0
+
+        if by == 'assignment':
+            points.append({'date': when.isoformat(), 'grade': grade, 'assignment_id': assignment_id,
+                           'description': description, 'category': category})
+            continue
+
+        bucket = when if by == 'day' else when - datetime.timedelta(days=when.weekday())
+        if points and points[-1]['date'] == bucket.isoformat():
+            points[-1]['grade'] = grade
+        else:
+            points.append({'date': bucket.isoformat(), 'grade': grade})
+
+    return {'points': points, 'undated': undated}
+
+
+def gpa_timeline(class_series):
+    """
+    Merge per-class day or week series into a GPA series.
+
+    Weighted like gpa.compute_gpa: each class's letter comes from its own
+    cutoffs, letters' points are averaged by credits, and the weighted GPA
+    adds the level bonus to passing letters.
+
+    Args:
+        class_series: Iterable of (points, cutoffs, credits, level), one per
+            class, where points is a grade_timeline list in date order
+
+    Returns:
+        List of {'date', 'gpa', 'weighted', 'classes'}; a class counts
+        towards the GPA from its first dated assignment on. Dates before any
+        counted class has credits are left out.
+    """
+    class_series = list(class_series)
+
+    def class_events(index, points):
+        return ((point['date'], index, point['grade']) for point in points)
+
+    events = heapq.merge(*(class_events(index, points)
+                           for index, (points, _, _, _) in enumerate(class_series)))
+
+    current = {}  # class index -> (points, weighted points)
+    total_credits = total_points = total_weighted = 0.0
+    result = []
+    for date, index, grade in events:
+        _, cutoffs, credits, level = class_series[index]
+        credits = credits or 0
+        points = grade_points(grade, cutoffs)
+        weighted = weighted_points(points, level)
+
+        old = current.get(index)
+        if old is None:
+            total_credits += credits
+        else:
+            total_points -= old[0] * credits
+            total_weighted -= old[1] * credits
+        total_points += points * credits
+        total_weighted += weighted * credits
+        current[index] = (points, weighted)
+        if not total_credits:
+            continue
+
+        point = {'date': date, 'gpa': total_points / total_credits,
+                 'weighted': total_weighted / total_credits, 'classes': len(current)}
+        if result and result[-1]['date'] == date:
+            result[-1] = point
+        else:
+            result.append(point)
+    return result
+
+
+def downsample(points, max_points, key='grade'):
+    """
+    Reduce a series to at most max_points for charting.
+
+    Uses largest-triangle-three-buckets, which keeps the first and last
+    points and the peaks and dips in between.
+    """
+    if not max_points or max_points >= len(points):
+        return points
+    if max_points < 3:
+        return [points[0], points[-1]][:max_points]
+
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (max_points - 2)
+    previous = 0
+    for i in range(max_points - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        # Average of the next bucket, the third corner of the triangle
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, len(points))
+        next_range = range(next_start, next_end) if next_end > next_start else range(len(points) - 1, len(points))
+        avg_x = sum(next_range) / len(next_range)
+        avg_y = sum(points[j][key] for j in next_range) / len(next_range)
+
+        prev_y = points[previous][key]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((previous - avg_x) * (points[j][key] - prev_y)
+                       - (previous - j) * (avg_y - prev_y))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        previous = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def _assignment_rows(conn, where, params):
+    return conn.execute(
+        f'''SELECT a.class_id, a.id, a.description, c.name, a.points_earned, a.points_possible,
+                   a.date_completed, a.due_date
+            FROM assignments a JOIN categories c ON c.id = a.category_id AND c.class_id = a.class_id
+            {where}''',
+        params
+    )
+
+
+def class_timeline(conn, class_id, by='assignment'):
+    """grade_timeline for one class, loaded from the database"""
+    categories = conn.execute('SELECT name, weight FROM categories WHERE class_id = ? ORDER BY id',
+                              (class_id,)).fetchall()
+    rows = _assignment_rows(conn, 'WHERE a.class_id = ?', (class_id,))
+    return grade_timeline(categories, (tuple(row)[1:] for row in rows), by)
+
+
+def user_gpa_timeline(conn, user_id, by='day'):
+    """
+    GPA over time across all of a user's classes, using each class's cutoffs,
+    credits and level.
+
+    Returns:
+        Dict with 'points' from gpa_timeline and 'undated' summed over classes
+    """
+    if by == 'assignment':
+        raise ValueError('GPA timelines are bucketed by day or week')
+
+    classes = {row['id']: row for row in conn.execute(
+        'SELECT id, credits, level, grade_scale FROM classes WHERE user_id = ?', (user_id,))}
+
+    categories = {}
+    for class_id, name, weight in conn.execute(
+            '''SELECT c.class_id, c.name, c.weight FROM categories c
+               JOIN classes cl ON cl.id = c.class_id
+               WHERE cl.user_id = ? ORDER BY c.id''', (user_id,)):
+        categories.setdefault(class_id, []).append((name, weight))
+
+    assignments = {class_id: [] for class_id in categories}
+    for row in _assignment_rows(conn, 'JOIN classes cl ON cl.id = a.class_id WHERE cl.user_id = ?',
+                                (user_id,)):
+        assignments[row[0]].append(tuple(row)[1:])
+
+    series = []
+    undated = 0
+    for class_id, class_categories in categories.items():
+        timeline = grade_timeline(class_categories, assignments[class_id], by)
+        class_info = classes[class_id]
+        series.append((timeline['points'], parse_cutoffs(class_info['grade_scale']),
+                       class_info['credits'], class_info['level']))
+        undated += timeline['undated']
+    return {'points': gpa_timeline(series), 'undated': undated}
@@ -0,0 +1,158 @@
+"""
+What-if grade solver.
+
+With every assignment's points possible fixed, calculate_grade is a sum of
+weight * earned / possible per category, so the final grade is an affine
+function of the scores still to come. The solver works that function out once
+and then evaluates whole score grids and required-score targets from it,
+without touching the database.
+"""
+from grade_engine import grade_from_totals
+
+# Upper bound on the number of grid points evaluated in one request
+MAX_SCENARIOS = 100000
+
+# Finest grid step accepted, in percentage points
+MIN_GRID_STEP = 0.01
+
+
+def _apply(categories, category, weight, earned, possible, count):
+    """Add (or with negative values remove) points from a category's totals"""
+    totals = categories.get(category)
+    if totals is None:
+        totals = categories[category] = [weight, 0.0, 0.0, 0]
+    totals[1] += earned or 0
+    totals[2] += possible
+    totals[3] += count
+
+
+def _to_rows(categories):
+    return [(name, t[0], t[1], t[2], t[3]) for name, t in categories.items()]
+
+
+def solve_what_if(category_rows, changes, grid_step=None, targets=(), max_scenarios=MAX_SCENARIOS):
+    """
+    Evaluate hypothetical assignments and score changes for one class.
+
+    Args:
+        category_rows: The class's current totals, as rows of (name, weight,
+            points_earned, points_possible, assignment_count) like
+            grade_engine.grade_from_totals takes.
+        changes: List of dicts with 'category', 'points_possible' and
+            optionally 'points_earned' and 'description'. Changes without
+            points_earned are pending and become the solver's variables.
+            A change with a 'replaces' dict (category, points_earned,
+            points_possible of an existing assignment) edits that assignment
+            instead of adding a new one.
+        grid_step: If set, evaluate every combination of 0..100% in this
+            step across the pending changes.
+        targets: Final grades to solve the minimum required scores for.
+        max_scenarios: Refuse grids larger than this.
+
+    Returns:
+        Dict with 'current' and 'projected' grade info (pending work at 0%,
+        as calculate_grade counts ungraded work), 'range' (pending at 0% and
+        100%), 'pending' descriptions, 'required' per target and optionally
+        'grid'. Required scores are percentages of the pending work's points
+        possible; values above 100 mean the target is out of reach.
+
+    Raises:
+        ValueError: If a change is invalid or the grid is too large.
+    """
+    targets = [float(target) for target in targets]
+    categories = {}
+    for name, weight, earned, possible, count in category_rows:
+        _apply(categories, name, weight, earned, possible or 0, count or 0)
+    current = grade_from_totals(_to_rows(categories))
+
+    pending = []
+    for change in changes:
+        category = change.get('category')
+        if category not in categories:
+            raise ValueError(f'Unknown category "{category}"')
+        possible = float(change['points_possible'])
+        if possible <= 0:
+            raise ValueError('points_possible must be greater than 0')
+        earned = change.get('points_earned')
+        earned = float(earned) if earned not in (None, '') else None
+
+        old = change.get('replaces')
+        if old:
+            _apply(categories, old['category'], None, -(old['points_earned'] or 0),
+                   -old['points_possible'], -1)
+        _apply(categories, category, None, earned, possible, 1)
+        if earned is None:
+            pending.append((change.get('description') or f'Pending {len(pending) + 1}',
+                            category, possible))
+
+    projected = grade_from_totals(_to_rows(categories))
+    base = projected['final_grade']
+
+    # Grade points gained per percentage point scored on each pending change
+    coefficients = []
+    for _, category, possible in pending:
+        weight, _, category_possible, _ = categories[category]
+        coefficients.append(weight * possible / (100 * category_possible))
+    total_coefficient = sum(coefficients)
+
+    result = {
+        'current': current,
+        'projected': projected,
+        'range': {'min': base, 'max': base + 100 * total_coefficient},
+        'pending': [{'description': d, 'category': c, 'points_possible': p} for d, c, p in pending],
+        'required': {},
+    }
+
+    per_category = {}
+    for (_, category, _), coefficient in zip(pending, coefficients):
+        per_category[category] = per_category.get(category, 0) + coefficient
+
+    for target in targets:
+        needed = target - base
+        required = {
+            'all': max(needed / total_coefficient, 0.0) if total_coefficient else None,
+            'by_category': {},
+        }
+        # Minimum on one category's pending work with the rest at 100%; work
+        # in a weight-0 category can't move the grade, so it has no minimum
+        for category, coefficient in per_category.items():
+            if not coefficient:
+                required['by_category'][category] = None
+                continue
+            others = 100 * (total_coefficient - coefficient)
+            required['by_category'][category] = max((needed - others) / coefficient, 0.0)
+        result['required'][str(target)] = required
+
+    if grid_step:
+        result['grid'] = _evaluate_grid(base, coefficients, float(grid_step), targets, max_scenarios)
+
+    return result
+
+
+def _evaluate_grid(base, coefficients, step, targets, max_scenarios):
+    """Final grade for every combination of pending scores, in row-major order"""
+    if not MIN_GRID_STEP <= step <= 100:
+        raise ValueError(f'grid_step must be between {MIN_GRID_STEP} and 100')
+
+    # Check the size before building anything
+    count = int(100 / step) + 1
+    if (count - 1) * step < 100:
+        count += 1
+    size = count ** len(coefficients)
+    if size > max_scenarios or count > max_scenarios:
+        raise ValueError(f'Grid has {max(size, count)} scenarios; the limit is {max_scenarios}')
+
+    steps = [min(i * step, 100.0) for i in range(count)]
+
+    # Extend the partial sums one pending assignment at a time, so each grid
+    # point costs a single addition
+    finals = [base]
+    for coefficient in coefficients:
+        offsets = [coefficient * s for s in steps]
+        finals = [f + o for f in finals for o in offsets]
+
+    return {
+        'steps': steps,
+        'final_grades': finals,
+        'meets_target': {str(t): sum(1 for f in finals if f >= t) for t in targets},
+    }